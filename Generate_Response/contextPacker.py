@@ -0,0 +1,230 @@
+"""
+Token-budgeted packing of the retrieved context for the diagnosis prompt.
+
+Prompt length drives prefill time on the local model, so instead of sending
+every KG block and RAG chunk we:
+  1. drop chunks of the same case that duplicate / are contained in another,
+  2. always keep the KG "MAIN INFORMATION" blocks first,
+  3. add the remaining chunks by descending retrieval score while they fit,
+  4. report how many tokens that saved.
+"""
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+CONTEXT_SEPARATOR = "\n------\n"
+CHUNK_SEPARATOR = "\n---\n"
+
+
+def main_information(knowledge: dict) -> Optional[str]:
+    """The KG "MAIN INFORMATION" lines of a case, or None if the graph has nothing."""
+    if not knowledge.get("has_info"):
+        return None
+    info_values = [
+        val for key, val in knowledge.items()
+        if val is not None and key not in ["case_id", "has_info"]
+    ]
+    return "\n".join(info_values)
+
+
+def format_case_context(main_info_block: Optional[str], context: str) -> str:
+    """One case's block; a section whose content is empty is left out with its header."""
+    if main_info_block is None:
+        return f"\nCONTEXTS FROM RAG:\n{context}\n" if context else ""
+    sections = []
+    if main_info_block:
+        sections.append(f"MAIN INFORMATION:\n{main_info_block}")
+    if context:
+        sections.append(f"ADDITIONAL CONTEXTS:\n{context}")
+    return "\n" + "\n---\n".join(sections) + "\n" if sections else ""
+
+
+class TokenCounter:
+    """
+    Counts tokens with the chat model's HF tokenizer (CHAT_TOKENIZER, e.g.
+    "Qwen/Qwen2.5-7B-Instruct"); without one, falls back to ~4 chars per token.
+    """
+
+    def __init__(self, tokenizer_id: Optional[str] = None):
+        self._tokenizer = None
+        tokenizer_id = tokenizer_id or os.getenv("CHAT_TOKENIZER")
+        if tokenizer_id:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(tokenizer_id)
+
+    @property
+    def exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is None:
+            return (len(text) + 3) // 4
+        return len(self._tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self._tokenizer is None:
+            return text[:max_tokens * 4]
+        ids = self._tokenizer.encode(text, add_special_tokens=False)
+        return text if len(ids) <= max_tokens else self._tokenizer.decode(ids[:max_tokens])
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_token_counter() -> TokenCounter:
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = TokenCounter()
+    return _counter
+
+
+@dataclass
+class _Chunk:
+    case_id: str
+    position: int
+    score: float
+    text: str  # enriched context, as rendered in the prompt
+    raw: str = ""  # payload text, compared when deduplicating
+    tokens: int = 0
+
+
+@dataclass
+class PackReport:
+    budget_tokens: int
+    tokens_before: int = 0
+    tokens_after: int = 0
+    chunks_in: int = 0
+    chunks_deduplicated: int = 0
+    chunks_dropped: int = 0
+    main_blocks_truncated: int = 0
+    exact_tokenizer: bool = False
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**self.__dict__, "tokens_saved": self.tokens_saved}
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def _shingles(text: str, n: int = 5) -> set:
+    words = text.split()
+    return {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+
+def _dedupe(chunks: List[_Chunk], jaccard: float) -> Tuple[List[_Chunk], int]:
+    """
+    Within one case: drop chunks equal to, contained in, or heavily overlapping
+    a better-scored one. Compares the raw chunk text: the enriched context
+    repeats the same case label lines in every chunk, which would inflate the
+    overlap of short but distinct chunks.
+    """
+    kept: List[Tuple[_Chunk, str, set]] = []
+    for chunk in sorted(chunks, key=lambda c: c.score, reverse=True):
+        norm = _normalize(chunk.raw or chunk.text)
+        sh = _shingles(norm)
+        duplicate = any(
+            norm in k_norm or (sh and len(sh & k_sh) / len(sh | k_sh) >= jaccard)
+            for _, k_norm, k_sh in kept
+        )
+        if not duplicate:
+            kept.append((chunk, norm, sh))
+    return [k[0] for k in kept], len(chunks) - len(kept)
+
+
+def pack_contexts(
+    hits: List[dict],
+    found_cases: List[str],
+    knowledge_graph_list: List[dict],
+    budget_tokens: int,
+    counter: Optional[TokenCounter] = None,
+    jaccard: float = 0.8,
+) -> Tuple[List[str], PackReport]:
+    """
+    Build the per-case context blocks (same layout as the unpacked prompt)
+    within budget_tokens. hits are retriever docs ({score, context, payload}),
+    found_cases / knowledge_graph_list come from process_item and
+    get_cases_knowledge_graph (aligned by index).
+    """
+    counter = counter or get_token_counter()
+    report = PackReport(budget_tokens=budget_tokens, exact_tokenizer=counter.exact)
+
+    by_case: Dict[str, List[_Chunk]] = {c: [] for c in found_cases}
+    for h in hits or []:
+        payload = h.get("payload") or {}
+        case_id = payload.get("case")
+        if case_id in by_case:
+            by_case[case_id].append(_Chunk(
+                case_id, len(by_case[case_id]), float(h.get("score", 0.0)), h.get("context", ""),
+                raw=payload.get("text") or "",
+            ))
+    report.chunks_in = sum(len(v) for v in by_case.values())
+
+    mains = {
+        case_id: main_information(knowledge_graph_list[i]) if i < len(knowledge_graph_list) else None
+        for i, case_id in enumerate(found_cases)
+    }
+    unpacked = [
+        format_case_context(mains[c], CHUNK_SEPARATOR.join(ch.text for ch in by_case[c]))
+        for c in found_cases
+    ]
+    report.tokens_before = counter.count(CONTEXT_SEPARATOR.join(unpacked))
+
+    # 1. dedupe within each case
+    for case_id, chunks in by_case.items():
+        by_case[case_id], dropped = _dedupe(chunks, jaccard)
+        report.chunks_deduplicated += dropped
+
+    # 2. KG main blocks first (block scaffolding is charged here too, headers of
+    #    both sections included)
+    remaining = budget_tokens
+    for case_id in found_cases:
+        main = mains[case_id]
+        scaffold = format_case_context(" " if main is not None else None, " ")
+        overhead = counter.count(scaffold) + counter.count(CONTEXT_SEPARATOR)
+        remaining -= overhead
+        if main is None:
+            continue
+        cost = counter.count(main)
+        if cost > remaining:
+            truncated = counter.truncate(main, max(remaining, 0))
+            first_line = main.split("\n", 1)[0]
+            # never cut the case's KG summary down to nothing
+            mains[case_id] = truncated if len(truncated) >= len(first_line) else first_line
+            report.main_blocks_truncated += 1
+            cost = counter.count(mains[case_id])
+        remaining -= cost
+
+    # 3. chunks by descending score while they fit
+    selected: Dict[str, List[_Chunk]] = {c: [] for c in found_cases}
+    candidates = sorted((ch for chunks in by_case.values() for ch in chunks), key=lambda c: c.score, reverse=True)
+    sep_cost = counter.count(CHUNK_SEPARATOR)
+    for ch in candidates:
+        ch.tokens = counter.count(ch.text) + sep_cost
+        if ch.tokens <= remaining:
+            selected[ch.case_id].append(ch)
+            remaining -= ch.tokens
+        else:
+            report.chunks_dropped += 1
+
+    # 4. render in case order, chunks in their original order
+    blocks = []
+    for case_id in found_cases:
+        chunks = sorted(selected[case_id], key=lambda c: c.position)
+        block = format_case_context(mains[case_id], CHUNK_SEPARATOR.join(c.text for c in chunks))
+        if block:
+            blocks.append(block)
+
+    report.tokens_after = counter.count(CONTEXT_SEPARATOR.join(blocks))
+    return blocks, report
@@ -0,0 +1,291 @@
+"""
+Micro-batching scheduler for diagnosis generation.
+
+Requests are queued (bounded, so callers get backpressure instead of an
+ever-growing backlog) and a dispatcher sends whatever is ready together via
+`chain.abatch`, keeping at most `max_in_flight` generations running against the
+local model. Each request can carry a deadline; requests that expire or whose
+caller gave up while queued are dropped before reaching the model.
+Streamed generations cannot be batched; they hold one of the same in-flight
+slots through reserve(), under the same queue bound and deadline rules.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+
+class SchedulerFull(RuntimeError):
+    """Raised by submit() when the request queue is at capacity."""
+
+
+@dataclass
+class _Request:
+    inputs: Dict[str, Any]
+    future: asyncio.Future
+    enqueued_at: float
+    deadline: Optional[float] = None
+
+
+@dataclass
+class _Stats:
+    submitted: int = 0
+    completed: int = 0
+    rejected: int = 0
+    expired: int = 0
+    cancelled: int = 0
+    failed: int = 0
+    batches: int = 0
+    batched_requests: int = 0
+    queue_wait_s: List[float] = field(default_factory=list)
+    generation_s: List[float] = field(default_factory=list)
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"avg": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "avg": sum(ordered) / len(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        "max": ordered[-1],
+    }
+
+
+class GenerationScheduler:
+    """
+    Must be created and used on a single event loop (the pipeline loop).
+
+    max_in_flight : prompts being generated at once
+    max_batch     : prompts sent in one abatch call
+    batch_wait_ms : how long the dispatcher waits for more prompts to join a batch
+    """
+
+    def __init__(
+        self,
+        chain,
+        max_queue: int = 64,
+        max_in_flight: int = 2,
+        max_batch: int = 4,
+        batch_wait_ms: float = 5.0,
+        max_samples: int = 10_000,
+    ):
+        self._chain = chain
+        self._queue: "asyncio.Queue[_Request]" = asyncio.Queue(maxsize=max_queue)
+        self._max_in_flight = max_in_flight
+        self._max_batch = max_batch
+        self._batch_wait_s = batch_wait_ms / 1000.0
+        self._max_samples = max_samples
+
+        self._in_flight = 0
+        self._reserving = 0  # reserve() callers waiting for a slot
+        self._slots = asyncio.Condition()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._batch_tasks: Set[asyncio.Task] = set()  # strong refs: the loop only keeps weak ones
+        self._stats = _Stats()
+
+    # ---- public API ----------------------------------------------------------
+
+    async def submit(self, inputs: Dict[str, Any], timeout_s: Optional[float] = None):
+        """
+        Queue one prompt and wait for the model's message.
+        Raises SchedulerFull if the queue is full and TimeoutError if the deadline
+        passes; cancelling the awaiting task withdraws a still-queued request.
+        """
+        self._ensure_dispatcher()
+        loop = asyncio.get_running_loop()
+        now = time.perf_counter()
+        req = _Request(
+            inputs=inputs,
+            future=loop.create_future(),
+            enqueued_at=now,
+            deadline=now + timeout_s if timeout_s else None,
+        )
+        try:
+            self._queue.put_nowait(req)
+        except asyncio.QueueFull:
+            self._stats.rejected += 1
+            raise SchedulerFull(f"generation queue is full ({self._queue.maxsize} waiting)")
+        self._stats.submitted += 1
+
+        try:
+            if timeout_s:
+                return await asyncio.wait_for(asyncio.shield(req.future), timeout_s)
+            return await asyncio.shield(req.future)
+        except asyncio.TimeoutError:
+            req.future.cancel()
+            self._stats.expired += 1
+            raise
+        except asyncio.CancelledError:
+            req.future.cancel()
+            self._stats.cancelled += 1
+            raise
+
+    @asynccontextmanager
+    async def reserve(self, timeout_s: Optional[float] = None):
+        """
+        Hold one in-flight slot for a generation run outside the batcher
+        (streaming). Waiting callers count against the queue bound, so this
+        raises SchedulerFull like submit(), and TimeoutError if no slot frees
+        up within timeout_s.
+        """
+        if self._queue.qsize() + self._reserving >= self._queue.maxsize:
+            self._stats.rejected += 1
+            raise SchedulerFull(f"generation queue is full ({self._queue.maxsize} waiting)")
+        self._stats.submitted += 1
+        self._reserving += 1
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._acquire_slot(), timeout_s)
+        except asyncio.TimeoutError:
+            self._stats.expired += 1
+            raise
+        except asyncio.CancelledError:
+            self._stats.cancelled += 1
+            raise
+        finally:
+            self._reserving -= 1
+        t_acquired = time.perf_counter()
+        self._record(self._stats.queue_wait_s, t_acquired - t0)
+
+        try:
+            yield
+            self._stats.completed += 1
+        except BaseException:
+            self._stats.failed += 1
+            raise
+        finally:
+            self._record(self._stats.generation_s, time.perf_counter() - t_acquired)
+            async with self._slots:
+                self._in_flight -= 1
+                self._slots.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        s = self._stats
+        return {
+            "submitted": s.submitted,
+            "completed": s.completed,
+            "rejected": s.rejected,
+            "expired": s.expired,
+            "cancelled": s.cancelled,
+            "failed": s.failed,
+            "queued": self._queue.qsize() + self._reserving,
+            "in_flight": self._in_flight,
+            "batches": s.batches,
+            "avg_batch_size": s.batched_requests / s.batches if s.batches else 0.0,
+            "queue_wait_s": _summary(s.queue_wait_s),
+            "generation_s": _summary(s.generation_s),
+        }
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        tasks = list(self._batch_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ---- dispatcher ----------------------------------------------------------
+
+    async def _acquire_slot(self):
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < self._max_in_flight)
+            self._in_flight += 1
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch_loop())
+
+    def _record(self, samples: List[float], value: float):
+        samples.append(value)
+        if len(samples) > self._max_samples:
+            del samples[: len(samples) - self._max_samples]
+
+    def _live(self, req: _Request, now: float) -> bool:
+        """False for requests whose caller already gave up or whose deadline passed."""
+        if req.future.done():
+            return False
+        if req.deadline is not None and now >= req.deadline:
+            req.future.set_exception(asyncio.TimeoutError())
+            return False
+        return True
+
+    async def _dispatch_loop(self):
+        while True:
+            first = await self._queue.get()
+
+            # claim the slots now, so reserve() can't take them while partners gather
+            async with self._slots:
+                await self._slots.wait_for(lambda: self._in_flight < self._max_in_flight)
+                claimed = min(self._max_batch, self._max_in_flight - self._in_flight)
+                self._in_flight += claimed
+
+            batch = [first]
+            try:
+                wait_until = time.perf_counter() + self._batch_wait_s
+                while len(batch) < claimed:
+                    remaining = wait_until - time.perf_counter()
+                    try:
+                        batch.append(self._queue.get_nowait() if remaining <= 0 else
+                                     await asyncio.wait_for(self._queue.get(), remaining))
+                    except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                        break
+            except asyncio.CancelledError:
+                for req in batch:  # close() while gathering partners
+                    req.future.cancel()
+                await self._release_slots(claimed)
+                raise
+
+            now = time.perf_counter()
+            batch = [req for req in batch if self._live(req, now)]
+            await self._release_slots(claimed - len(batch))
+            if not batch:
+                continue
+
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch, now))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _release_slots(self, n: int):
+        if n <= 0:
+            return
+        async with self._slots:
+            self._in_flight -= n
+            self._slots.notify_all()
+
+    async def _run_batch(self, batch: List[_Request], dispatched_at: float):
+        for req in batch:
+            self._record(self._stats.queue_wait_s, dispatched_at - req.enqueued_at)
+        self._stats.batches += 1
+        self._stats.batched_requests += len(batch)
+
+        try:
+            results = await self._chain.abatch(
+                [req.inputs for req in batch],
+                config={"max_concurrency": len(batch)},
+                return_exceptions=True,
+            )
+            elapsed = time.perf_counter() - dispatched_at
+            for req, result in zip(batch, results):
+                self._record(self._stats.generation_s, elapsed)
+                if req.future.done():
+                    continue  # caller gave up while generating
+                if isinstance(result, Exception):
+                    self._stats.failed += 1
+                    req.future.set_exception(result)
+                else:
+                    self._stats.completed += 1
+                    req.future.set_result(result)
+        except Exception as e:
+            for req in batch:
+                if not req.future.done():
+                    self._stats.failed += 1
+                    req.future.set_exception(e)
+        except asyncio.CancelledError:
+            for req in batch:  # close(): don't leave callers waiting forever
+                req.future.cancel()
+            raise
+        finally:
+            await self._release_slots(len(batch))
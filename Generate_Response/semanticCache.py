@@ -0,0 +1,79 @@
+"""
+Semantic answer cache for diagnoses.
+
+Many questions are paraphrases of ones already answered. An entry stores
+(question embedding, retrieved case ids, answer); a new question reuses the
+answer when its embedding is within `threshold` cosine similarity of a stored
+one AND retrieval returned the same set of cases, so the LLM saw equivalent
+evidence. The index is a preallocated in-memory matrix (brute-force dot
+products are plenty at this size) with least-recently-used eviction.
+"""
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, dim: int = 768, threshold: float = 0.95, max_items: int = 2048):
+        self._threshold = threshold
+        self._max_items = max_items
+        self._lock = threading.Lock()
+
+        self._vectors = np.zeros((max_items, dim), dtype=np.float32)
+        self._case_sets = [None] * max_items
+        self._answers = [None] * max_items
+        self._last_used = np.zeros(max_items, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+
+        self.lookups = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def lookup(self, embedding, case_ids: Iterable[str]) -> Optional[str]:
+        """Cached answer for a similar question over the same cases, else None."""
+        q = self._unit(embedding)
+        cases = frozenset(case_ids)
+        with self._lock:
+            self.lookups += 1
+            if self._size == 0:
+                return None
+            sims = self._vectors[:self._size] @ q
+            for i in np.flatnonzero(sims >= self._threshold)[np.argsort(-sims[sims >= self._threshold])]:
+                if self._case_sets[i] == cases:
+                    self._clock += 1
+                    self._last_used[i] = self._clock
+                    self.hits += 1
+                    return self._answers[i]
+        return None
+
+    def put(self, embedding, case_ids: Iterable[str], answer: str):
+        q = self._unit(embedding)
+        with self._lock:
+            if self._size < self._max_items:
+                i = self._size
+                self._size += 1
+            else:
+                i = int(np.argmin(self._last_used[:self._size]))
+                self.evictions += 1
+            self._clock += 1
+            self._vectors[i] = q
+            self._case_sets[i] = frozenset(case_ids)
+            self._answers[i] = answer
+            self._last_used[i] = self._clock
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "items": self._size,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,219 @@
+"""
+Long-lived HTTP service for the hybrid RAG diagnosis pipeline.
+
+Models (embedding, reranker), the Qdrant clients and the graph handle are
+loaded once at startup and shared by every request on the server's event loop.
+Admission control keeps at most SERVER_MAX_IN_FLIGHT requests running and
+SERVER_MAX_QUEUE waiting; beyond that requests get 503 + Retry-After instead
+of piling up.
+
+    uvicorn Generate_Response.server:app --host 0.0.0.0 --port 8000
+"""
+import asyncio
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+from Generate_Response.scheduler import SchedulerFull
+from Generate_Response.trindsLangchain import (
+    agenerate_response,
+    astream_response,
+    get_answer_cache,
+    get_scheduler,
+)
+from RAG.utils.logSampling import configure_logging
+from RAG.utils.metrics import metrics
+from RAG.utils.resources import resources
+
+load_dotenv()
+
+
+class DiagnoseRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    stream: bool = False
+    timeout_s: Optional[float] = None
+
+
+class RetrieveRequest(BaseModel):
+    question: str = Field(..., min_length=1)
+    k: int = Field(3, ge=1, le=50)
+    filters: Optional[Dict[str, Any]] = None
+
+
+class _Admission:
+    """Bounded concurrency with a bounded waiting room."""
+
+    def __init__(self, max_in_flight: int, max_queue: int):
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._capacity = max_in_flight + max_queue
+        self.active = 0  # running + waiting
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.active >= self._capacity:
+            self.rejected += 1
+            raise HTTPException(status_code=503, detail="server busy", headers={"Retry-After": "1"})
+        self.active += 1
+        try:
+            async with self._semaphore:
+                yield
+        finally:
+            self.active -= 1
+
+
+admission = _Admission(
+    max_in_flight=int(os.getenv("SERVER_MAX_IN_FLIGHT", "8")),
+    max_queue=int(os.getenv("SERVER_MAX_QUEUE", "32")),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # pay model loading / connections once, before accepting traffic
+    await asyncio.to_thread(resources.warmup, os.getenv("SERVER_PRELOAD_GRAPH", "1") == "1")
+    scheduler = get_scheduler()  # bind it to the server loop up front
+    yield
+    if scheduler is not None:
+        await scheduler.close()
+    await resources.retriever.aclose()
+    await asyncio.to_thread(resources.close)
+
+
+app = FastAPI(title="TRINDs diagnosis", lifespan=lifespan)
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@app.post("/retrieve")
+async def retrieve(req: RetrieveRequest):
+    async with admission.slot():
+        hits = await resources.retriever.query(req.question, k=req.k, filters=req.filters)
+    return {"hits": hits}
+
+
+def _generation_error(e: BaseException) -> Optional[HTTPException]:
+    """HTTP status for a generation failure the client should see, else None."""
+    if isinstance(e, SchedulerFull):
+        return HTTPException(status_code=503, detail="generation queue full", headers={"Retry-After": "1"})
+    if isinstance(e, asyncio.TimeoutError):
+        return HTTPException(status_code=504, detail="generation deadline exceeded")
+    return None
+
+
+@app.post("/diagnose")
+async def diagnose(req: DiagnoseRequest):
+    if req.stream:
+        return await _diagnose_stream(req)
+
+    async with admission.slot():
+        timings: Dict[str, Any] = {}
+        try:
+            answer = await agenerate_response(req.question, timings, req.timeout_s)
+        except (SchedulerFull, asyncio.TimeoutError) as e:
+            raise _generation_error(e) from e
+    return {"answer": answer, "timings": timings}
+
+
+async def _diagnose_stream(req: DiagnoseRequest):
+    """
+    Same admission, scheduler, deadline and cache rules as the JSON path.
+    The slot and the first token are taken before answering, so overload and
+    deadline errors still map to 503/504. The slot is released exactly once:
+    by the body when it finishes, or by the background task when the body
+    never ran (client gone before the response started).
+    """
+    stack = AsyncExitStack()
+    await stack.enter_async_context(admission.slot())
+    tokens = astream_response(req.question, timeout_s=req.timeout_s)
+    released = False
+
+    async def release():
+        nonlocal released
+        if not released:
+            released = True
+            try:
+                await tokens.aclose()
+            finally:
+                await stack.aclose()
+
+    try:
+        try:
+            first = await tokens.__anext__()
+        except StopAsyncIteration:
+            first = ""
+
+        async def body():
+            try:
+                if first:
+                    yield first
+                async for token in tokens:
+                    yield token
+            finally:
+                await release()
+
+        return StreamingResponse(
+            body(), media_type="text/plain; charset=utf-8", background=BackgroundTask(release),
+        )
+    except BaseException as e:
+        await release()
+        error = _generation_error(e)
+        if error is not None:
+            raise error from e
+        raise
+
+
+@app.get("/stats")
+async def stats():
+    retriever = resources.retriever
+    out: Dict[str, Any] = {
+        "admission": {"active": admission.active, "rejected": admission.rejected},
+        "retriever": retriever.stats(),
+        "reranker": resources.reranker.stats(),
+    }
+    embedding_fn = getattr(retriever, "_embedding_fn", None)
+    if hasattr(embedding_fn, "stats"):
+        out["embedding_cache"] = embedding_fn.stats()
+    scheduler = get_scheduler()
+    if scheduler is not None:
+        out["scheduler"] = scheduler.stats()
+    answer_cache = get_answer_cache()
+    if answer_cache is not None:
+        out["semantic_cache"] = answer_cache.stats()
+    return out
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage latency histograms and cache/rerank counters, Prometheus text format."""
+    return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics.json")
+async def json_metrics():
+    return metrics.to_json()
+
+
+def main():
+    import uvicorn
+
+    configure_logging()
+
+    uvicorn.run(
+        "Generate_Response.server:app",
+        host=os.getenv("SERVER_HOST", "0.0.0.0"),
+        port=int(os.getenv("SERVER_PORT", "8000")),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,46 @@
 import asyncio
+import contextlib
+import logging
 import os
-from typing import Any
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_ollama import ChatOllama
 from RAG.QdrantRetriever import get_retriever
-from RAG.utils.queryVectorDB import process_item, get_cases_knowledge_graph, graph
+from RAG.utils.queryVectorDB import process_item, get_cases_knowledge_graph
+from RAG.utils.logSampling import configure_logging, should_dump
+from RAG.utils.metrics import metrics
+from RAG.utils.resources import get_case_knowledge
+from Generate_Response.contextPacker import format_case_context, main_information, pack_contexts
+from Generate_Response.semanticCache import SemanticAnswerCache
+from Generate_Response.scheduler import GenerationScheduler
 from dotenv import load_dotenv
 
 load_dotenv()
 
-model = ChatOllama(model=os.getenv("CHAT_MODEL"), reasoning=None)
+logger = logging.getLogger(__name__)
+
+
+def _model_options() -> dict:
+    """
+    Ollama options from the environment. Keep them constant across calls: a
+    different num_ctx reloads the model, and an evicted model loses its KV cache.
+      CHAT_KEEP_ALIVE  how long the model stays resident ("30m", or -1 = forever)
+      CHAT_NUM_CTX     context window; too small and Ollama truncates the prompt
+                       from the front, i.e. drops the cached system prefix
+    """
+    options = {}
+    keep_alive = os.getenv("CHAT_KEEP_ALIVE")
+    if keep_alive:
+        options["keep_alive"] = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+    if os.getenv("CHAT_NUM_CTX"):
+        options["num_ctx"] = int(os.getenv("CHAT_NUM_CTX"))
+    return options
+
+
+model = ChatOllama(model=os.getenv("CHAT_MODEL"), reasoning=None, **_model_options())
 
 """
 ChatOllama utilizes the model's internal chat template (e.g., <|im_start|>system...).
@@ -105,28 +136,365 @@ prompt = ChatPromptTemplate.from_messages([
     ("human", concise_human_template),
 ])
 
+# Constant system instructions first, per-request context and question last, so
+# Ollama reuses the KV cache for the system prefix (see prefill_tokens in the
+# timings); resident-model options are in _model_options.
 chain = prompt | model
 
 
-def generate_response(question: str) -> str:
-    contexts_list = with_naive_kg(question)
+def _record_prefill(timings: dict, metadata: dict | None) -> None:
+    """
+    Prefill stats from Ollama's response metadata: prefill_tokens is the number
+    of prompt tokens actually evaluated, so it drops on a prefix-cache hit.
+    """
+    if not metadata or metadata.get("prompt_eval_count") is None:
+        return
+    timings["prefill_tokens"] = metadata["prompt_eval_count"]
+    if metadata.get("prompt_eval_duration"):
+        timings["prefill_s"] = metadata["prompt_eval_duration"] / 1e9
+    if metadata.get("load_duration"):
+        timings["model_load_s"] = metadata["load_duration"] / 1e9
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    One long-lived event loop on a daemon thread, shared by every sync entry point,
+    so clients, semaphores and caches bound to it survive across questions
+    (instead of asyncio.run creating and tearing down a loop per call).
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="trinds-pipeline", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the shared pipeline loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def build_final_contexts(contexts_list: list[str], knowledge_graph_list: list[dict]) -> list[str]:
+    """One context block per case: KG main information first (if any), then the RAG chunks."""
+    final_list = []
+    for index, context in enumerate(contexts_list):
+        knowledge = knowledge_graph_list[index] if index < len(knowledge_graph_list) else {}
+        final_list.append(format_case_context(main_information(knowledge), context))
+    return final_list
+
+
+async def awith_naive_kg(question: str, timings: dict | None = None) -> list[str]:
+    final_list, _ = await _aretrieve_contexts(question, timings)
+    return final_list
+
+
+async def _aretrieve_contexts(question: str, timings: dict | None = None) -> tuple[list[str], list[str]]:
+    """
+    Naive RAG (Qdrant) + knowledge graph (Neo4j) contexts for a question.
+
+    As soon as the dense search has produced candidates, the knowledge-graph
+    fetch for the leading candidate cases (KG_PREFETCH_CASES, default 2 * k)
+    starts in a thread and overlaps with reranking and enrichment; the final
+    lookup for the reranked cases is then mostly served by the KG cache.
+    Stage durations (seconds) are written into `timings` if given.
+
+    With CONTEXT_TOKEN_BUDGET set, the blocks are packed to that many tokens
+    (see contextPacker.py) and the packing report lands in timings["context_pack"].
+    """
+    timings = timings if timings is not None else {}
+    t_start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    retriever = get_retriever()
+    kg_source = get_case_knowledge()
+    k = 3
+    # the candidate pool is ~10 * k hits; the top-k cases almost always come
+    # from its head, so only that much is worth a Neo4j round trip up front
+    prefetch_cases = int(os.getenv("KG_PREFETCH_CASES", str(2 * k)))
+
+    prefetch = []
+
+    def start_prefetch(cases):
+        if not prefetch and prefetch_cases > 0:
+            prefetch.append(asyncio.ensure_future(
+                asyncio.to_thread(get_cases_knowledge_graph, kg_source, cases[:prefetch_cases])
+            ))
+
+    def on_candidates(cases):
+        # may be called from the retrieval thread; hop onto the loop
+        loop.call_soon_threadsafe(start_prefetch, cases)
+
+    # prefetching only pays off when the final lookup is served from a cache
+    caches_kg = hasattr(kg_source, "fetch_case_knowledge")
+    hits = await retriever.query(question, k=k, on_candidates=on_candidates if caches_kg else None)
+    t_retrieved = time.perf_counter()
+    timings["retrieval_s"] = t_retrieved - t_start
+
+    # ___________________WITH NAIVE RAG + KNOWLEDGE GRAPH: (QDRANT + NEO4J)______________________
+    item = await process_item(hits)
+    ids = item.get("found_cases", [])
+    contexts_list = item.get("context", [])
+
+    if prefetch:
+        # a failed prefetch is not fatal: the lookup below will retry and surface the error
+        await asyncio.gather(*prefetch, return_exceptions=True)
+    knowledge_graph_list = await asyncio.to_thread(get_cases_knowledge_graph, kg_source, ids)
+    t_kg = time.perf_counter()
+    timings["kg_wait_s"] = t_kg - t_retrieved  # KG time not hidden behind retrieval
+
+    budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+    if budget > 0:
+        final_list, report = pack_contexts(hits, ids, knowledge_graph_list, budget)
+        timings["context_pack"] = report.as_dict()
+    else:
+        final_list = build_final_contexts(contexts_list, knowledge_graph_list)
+    timings["contexts_s"] = time.perf_counter() - t_kg
+    return final_list, ids
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache | None:
+    """Semantic answer cache, enabled with SEMANTIC_CACHE=1 (threshold: SEMANTIC_CACHE_THRESHOLD)."""
+    global _answer_cache
+    if os.getenv("SEMANTIC_CACHE", "0") != "1":
+        return None
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache(
+                    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+                    max_items=int(os.getenv("SEMANTIC_CACHE_SIZE", "2048")),
+                )
+    return _answer_cache
+
+
+_scheduler = None
+
+
+def get_scheduler() -> GenerationScheduler | None:
+    """
+    Micro-batching generation scheduler, enabled with GENERATION_SCHEDULER=1.
+    Created lazily on the running (pipeline) loop, which it must stay on.
+    """
+    global _scheduler
+    if os.getenv("GENERATION_SCHEDULER", "0") != "1":
+        return None
+    if _scheduler is None:
+        _scheduler = GenerationScheduler(
+            chain,
+            max_queue=int(os.getenv("GENERATION_QUEUE_SIZE", "64")),
+            max_in_flight=int(os.getenv("GENERATION_MAX_IN_FLIGHT", "2")),
+            max_batch=int(os.getenv("GENERATION_MAX_BATCH", "4")),
+            batch_wait_ms=float(os.getenv("GENERATION_BATCH_WAIT_MS", "5")),
+        )
+    return _scheduler
+
+
+@metrics.timed("generate")
+async def agenerate_response(question: str, timings: dict | None = None, timeout_s: float | None = None) -> str:
+    """
+    Retrieve + generate. timeout_s bounds the generation step, raising
+    TimeoutError; with the scheduler enabled it includes the queue wait
+    (queued requests past it never reach the model).
+    """
+    timings = timings if timings is not None else {}
+    t_start = time.perf_counter()
+    with metrics.span("retrieve_contexts"):
+        contexts_list, case_ids = await _aretrieve_contexts(question, timings)
     all_contexts = "\n------\n".join(contexts_list)
-    result = chain.invoke({"rag_documents": all_contexts, "question": question})
-    print(f"Retrieved {len(contexts_list)} contexts: {all_contexts}\n")
-    print(f"Response: {result}")
-    print(f"Result's content:\n{result.content}")
+
+    answer_cache, question_vec, cached = await _semantic_lookup(question, case_ids, timings)
+    if cached is not None:
+        timings["total_s"] = time.perf_counter() - t_start
+        return cached
+
+    t_llm = time.perf_counter()
+    inputs = {"rag_documents": all_contexts, "question": question}
+    scheduler = get_scheduler()
+    with metrics.span("llm"):
+        if scheduler is not None:
+            result = await scheduler.submit(inputs, timeout_s)
+        else:
+            result = await asyncio.wait_for(chain.ainvoke(inputs), timeout_s)
+    timings["llm_s"] = time.perf_counter() - t_llm  # includes scheduler queue wait
+    _record_prefill(timings, result.response_metadata)
+    timings["total_s"] = time.perf_counter() - t_start
+
+    if answer_cache is not None:
+        answer_cache.put(question_vec, case_ids, result.content)
+
+    _log_generation(contexts_list, all_contexts, result)
     return result.content
 
+
+async def _semantic_lookup(question: str, case_ids: list[str], timings: dict):
+    """
+    (answer cache, question vector, cached answer or None) for a paraphrase of
+    an answered question over the same cases; all None when the cache is off.
+    """
+    answer_cache = get_answer_cache()
+    if answer_cache is None:
+        return None, None, None
+    # already embedded (and cached) during retrieval, so this is a lookup
+    question_vec = await asyncio.to_thread(get_retriever().embed_query, question)
+    cached = answer_cache.lookup(question_vec, case_ids)
+    timings["semantic_cache_hit"] = cached is not None
+    metrics.inc("cache_hits_total" if cached is not None else "cache_misses_total", cache="semantic_answer")
+    return answer_cache, question_vec, cached
+
+
+def _log_generation(contexts: list, all_contexts: str, result) -> None:
+    """Sampled DEBUG dump of the prompt context and raw model response."""
+    if should_dump(logger):
+        logger.debug("Retrieved %d contexts:\n%s", len(contexts), all_contexts)
+        logger.debug("Response: %r", result)
+
+
+def generate_response(question: str, timings: dict | None = None) -> str:
+    return run_sync(agenerate_response(question, timings))
+
+_EXPLANATION_RE = re.compile(r"Explanation:\s*\S")
+_BLOCK_END_RE = re.compile(r"\n\s*\n|\n(?=(?:Diagnosis|References?|Note|Sources?)\s*:)", re.IGNORECASE)
+
+
+def _explanation_end(text: str) -> int | None:
+    """
+    Index where the answer is complete: the blank line (or next header line)
+    after a non-empty "Explanation:" block. None while it is still being written.
+    """
+    m = _EXPLANATION_RE.search(text)
+    if not m:
+        return None
+    end = _BLOCK_END_RE.search(text, m.end())
+    return end.start() if end else None
+
+
+async def _next_before(stream: AsyncIterator, deadline: float | None):
+    """Next chunk of stream, raising TimeoutError once the deadline has passed."""
+    if deadline is None:
+        return await stream.__anext__()
+    remaining = deadline - time.perf_counter()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()
+    return await asyncio.wait_for(stream.__anext__(), remaining)
+
+
+async def astream_response(
+    question: str, stats: dict | None = None, timeout_s: float | None = None,
+) -> AsyncIterator[str]:
+    """
+    Stream the diagnosis as the model produces it, stopping as soon as the
+    "Explanation:" block is complete (the rest of the generation is cancelled).
+
+    Same rules as agenerate_response: a semantic-cache hit is yielded as one
+    chunk without calling the model; with the scheduler enabled the stream
+    holds one of its in-flight slots (SchedulerFull when its queue is full);
+    timeout_s bounds the generation, slot wait included (TimeoutError).
+
+    stats (optional dict) receives: retrieval timings, ttft_s (question ->
+    first token), llm_ttft_s (prompt sent -> first token), tokens (streamed
+    chunks), tokens_per_s, total_s, stopped_early, and prefill_tokens /
+    prefill_s when the final chunk arrives (not after an early stop).
+    """
+    stats = stats if stats is not None else {}
+    t_start = time.perf_counter()
+    contexts_list, case_ids = await _aretrieve_contexts(question, stats)
+    all_contexts = "\n------\n".join(contexts_list)
+
+    answer_cache, question_vec, cached = await _semantic_lookup(question, case_ids, stats)
+    stats["stopped_early"] = False
+    if cached is not None:
+        stats["total_s"] = time.perf_counter() - t_start
+        yield cached
+        return
+
+    deadline = time.perf_counter() + timeout_s if timeout_s else None
+    scheduler = get_scheduler()
+    answer = []
+    async with (scheduler.reserve(timeout_s) if scheduler is not None else contextlib.nullcontext()):
+        async for piece in _astream_llm(all_contexts, question, stats, t_start, deadline, answer):
+            yield piece
+
+    if answer_cache is not None and answer:
+        answer_cache.put(question_vec, case_ids, answer[0])
+
+
+async def _astream_llm(
+    all_contexts: str, question: str, stats: dict, t_start: float, deadline: float | None, answer: list,
+) -> AsyncIterator[str]:
+    """Token loop of astream_response; appends the full streamed text to `answer` once done."""
+    text, tokens = "", 0
+    t_first = None
+    t_llm = time.perf_counter()
+    stream = chain.astream({"rag_documents": all_contexts, "question": question})
+    try:
+        while True:
+            try:
+                chunk = await _next_before(stream, deadline)
+            except StopAsyncIteration:
+                break
+            _record_prefill(stats, chunk.response_metadata)
+            piece = chunk.content or ""
+            if not piece:
+                continue
+            if t_first is None:
+                t_first = time.perf_counter()
+                stats["ttft_s"] = t_first - t_start
+                stats["llm_ttft_s"] = t_first - t_llm
+                metrics.observe("ttft_seconds", stats["ttft_s"])
+            tokens += 1
+
+            end = _explanation_end(text + piece)
+            if end is not None:
+                piece = piece[:max(end - len(text), 0)]
+                text += piece
+                if piece:
+                    yield piece
+                stats["stopped_early"] = True
+                break
+            text += piece
+            yield piece
+        answer.append(text)
+    finally:
+        await stream.aclose()
+        t_end = time.perf_counter()
+        stats["tokens"] = tokens
+        stats["total_s"] = t_end - t_start
+        if t_first is not None and t_end > t_first:
+            stats["tokens_per_s"] = tokens / (t_end - t_first)
+
+
+def stream_response(question: str, stats: dict | None = None, timeout_s: float | None = None) -> Iterator[str]:
+    """Sync generator over astream_response, driven on the shared pipeline loop."""
+    agen = astream_response(question, stats, timeout_s)
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(agen.aclose())
+
+
 def generate_response_with_context(question: str, contexts: list[Any]) -> str:
     all_contexts = "\n------\n".join(contexts)
     result = chain.invoke({"rag_documents": all_contexts, "question": question})
-    print(f"Retrieved {len(contexts)} contexts: {all_contexts}\n")
-    print(f"Response: {result}")
-    print(f"Result's content:\n{result.content}")
+    _log_generation(contexts, all_contexts, result)
     return result.content
 
 
 def demo():
+    configure_logging()
     while True:
         print("\n\n-------------------------------")
         question = input(">>> ")
@@ -134,101 +502,34 @@ def demo():
         if question == "/bye":
             break
 
-        retriever = get_retriever()
-        hits = asyncio.run(retriever.query(question, k=3))
-
-        # ___________________WITH NAIVE RAG + KNOWLEDGE GRAPH: (QDRANT + NEO4J)______________________
-        item = asyncio.run(process_item(hits))
-        ids = item.get("found_cases", [])
-        contexts_list = item.get("context", [])
-        print(f"Found cases: {ids}")
-        print(f"Contexts length: {len(contexts_list)}")
-
-        knowledge_graph_list = get_cases_knowledge_graph(graph, ids)
-        print(f"Knowledge graph length: {len(knowledge_graph_list)}")
-        print(f"Knowledge Graph List: {knowledge_graph_list}")
-        final_list = []
-        for index, context in enumerate(contexts_list):
-            knowledge = knowledge_graph_list[index]
-            if knowledge.get("has_info"):
-                info_values = [
-                    val for key, val in knowledge.items()
-                    if val is not None and key not in ["case_id", "has_info"]
-                ]
-                main_info_block = "\n".join(info_values)
-                final_context = f"""
-MAIN INFORMATION:
-{main_info_block}
----
-ADDITIONAL CONTEXTS:
-{context}
-"""
-            else:
-                final_context = f"""
-CONTEXTS FROM RAG:
-{context}
-"""
-            final_list.append(final_context)
-
-        all_contexts = "\n------\n".join(final_list)
-        result = chain.invoke({"rag_documents": all_contexts, "question": question})
-        print(f"Retrieved {len(contexts_list)} contexts: {all_contexts}\n")
-        print(f"Response: {result}")
-        print(f"Result's content:\n{result.content}")
+        timings = {}
+        print(generate_response(question, timings))
+        print("Timings: " + ", ".join(
+            f"{stage}={value * 1000:.0f}ms" for stage, value in timings.items() if stage.endswith("_s")
+        ))
+        if "prefill_tokens" in timings:
+            print(f"Prefill tokens: {timings['prefill_tokens']}")
+        if "context_pack" in timings:
+            print(f"Context packing: {timings['context_pack']}")
 
         # ___________________WITH NAIVE RAG ONLY: (QDRANT)______________________
-        # contexts_list = [hit.get("context", "") for hit in (hits or [])]
-        # all_contexts = "\n---\n".join(contexts_list)
-        # result = chain.invoke({"rag_documents": all_contexts, "question": question})
-        # print(f"Retrieved {len(contexts_list)} contexts: {all_contexts}\n")
-        # print(f"Response: {result}")
-        # print(f"Result's content:\n{result.content}")
-
-def with_naive_kg(question: str) -> list[Any] | None:
-    retriever = get_retriever()
-    hits = asyncio.run(retriever.query(question, k=3))
-    # ___________________WITH NAIVE RAG + KNOWLEDGE GRAPH: (QDRANT + NEO4J)______________________
-    item = asyncio.run(process_item(hits))
-    ids = item.get("found_cases", [])
-    contexts_list = item.get("context", [])
+        # contexts_list = with_naive_only(question)
+        # print(generate_response_with_context(question, contexts_list))
 
-    knowledge_graph_list = get_cases_knowledge_graph(graph, ids)
-    final_list = []
-    for index, context in enumerate(contexts_list):
-        knowledge = knowledge_graph_list[index]
-        if knowledge.get("has_info"):
-            info_values = [
-                val for key, val in knowledge.items()
-                if val is not None and key not in ["case_id", "has_info"]
-            ]
-            main_info_block = "\n".join(info_values)
-
-            final_context = f"""
-MAIN INFORMATION:
-{main_info_block}
----
-ADDITIONAL CONTEXTS:
-{context}
-"""
-        else:
-            final_context = f"""
-CONTEXTS FROM RAG:
-{context}
-"""
-        final_list.append(final_context)
-        return final_list
-    return None
+def with_naive_kg(question: str, timings: dict | None = None) -> list[Any]:
+    return run_sync(awith_naive_kg(question, timings))
 
 
 def with_naive_only(question: str) -> list[Any]:
     retriever = get_retriever()
-    hits = asyncio.run(retriever.query(question, k=3))
+    hits = run_sync(retriever.query(question, k=3))
     # ___________________WITH NAIVE RAG ONLY: (QDRANT)______________________
     contexts_list = [hit.get("context", "") for hit in (hits or [])]
     return contexts_list
 
 
 def main():
+    configure_logging()
     user_question = "My 10 year old nephew visited the Thanda Safari with us last week. Now he is sick with a fever, skin rash and itching foot. what is happening to him?"
     print(generate_response(user_question))
     # demo()
@@ -1,10 +1,18 @@
 import asyncio
+import json
 import os
-from typing import Any, Dict, Optional, List
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, List
 from langsmith import traceable
-from qdrant_client import QdrantClient
-from RAG.utils.embeddings import embed_text_query
-from RAG.utils.queryVectorDB import search_vectors_v2
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from RAG.utils.embeddings import embed_text_query, embed_text_queries
+from RAG.utils.embeddingCache import cached_query_embedder
+from RAG.utils.metrics import metrics
+from RAG.utils.caseLabelIndex import default_index_path, load_case_label_index
+from RAG.utils.queryVectorDB import search_vectors_v2, search_vectors_v2_async, search_vectors_v2_batch
 
 _client = None
 _retriever = None
@@ -17,34 +25,246 @@ class QdrantRetriever:
         embedding_fn=embed_text_query,
         using_vector="nomic-embed-text",
         static_filters: Optional[Dict[str, Any]] = None,
+        batch_embedding_fn=embed_text_queries,
+        case_label_index: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+        adaptive_rerank: bool = False,
+        sparse_vector: Optional[str] = None,
+        async_client: Optional[AsyncQdrantClient] = None,
+        async_client_factory: Optional[Callable[[], AsyncQdrantClient]] = None,
+        max_concurrency: int = 32,
+        cpu_workers: int = 4,
+        result_ttl_s: float = 30.0,
+        result_cache_size: int = 1024,
     ):
         self._client = client
         self._collection_name = collection_name
         self._embedding_fn = embedding_fn
+        self._batch_embedding_fn = batch_embedding_fn
         self._using_vector = using_vector
         self._static_filters = static_filters or {}
+        self._case_label_index = case_label_index
+        self._adaptive_rerank = adaptive_rerank
+        self._sparse_vector = sparse_vector  # e.g. "bm25" to enable hybrid retrieval
+
+        # Native async path: network I/O stays on the event loop, embedding and
+        # reranking go to a small dedicated pool instead of the default executor,
+        # and at most max_concurrency queries are in flight at once.
+        # The client's connection pool and the semaphore belong to one event loop,
+        # so with a factory they are recreated when called from a new loop
+        # (e.g. successive asyncio.run calls) and the previous client is closed.
+        # The pool is only started by the first async query.
+        self._async_client = async_client
+        self._async_client_factory = async_client_factory
+        self._max_concurrency = max_concurrency
+        self._bound_loop = None
+        self._semaphore = None
+        self._cpu_workers = cpu_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+        # Single-flight: identical concurrent queries share one computation.
+        # concurrent.futures.Future (not asyncio) so waiters on other threads /
+        # event loops can join too; finished results live for result_ttl_s.
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_lock = threading.Lock()
+        self._result_ttl_s = result_ttl_s
+        self._result_cache_size = result_cache_size
+        self._results: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self.calls = 0
+        self.computed = 0
+        self.collapsed = 0
+        self.result_cache_hits = 0
 
     @traceable
-    async def query(self, query, k: int = 3, filters: Optional[Dict[str, Any]] = None) -> List[dict]:
+    async def query(
+        self,
+        query,
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None,
+        on_candidates: Optional[Callable[[List[str]], None]] = None,
+    ) -> List[dict]:
         """
         query: str | PIL.Image | image path
-        returns: [{id, score, context, payload}, ...]
+        on_candidates: called with the candidate case ids before reranking
+                       (not called when the result is shared or cached)
+        returns: [{id, score, context, payload, rerank_depth}, ...]
         """
         merged_filters = {**self._static_filters, **(filters or {})}
+        if not isinstance(query, str):
+            return await self._query_uncached(query, k, merged_filters, on_candidates)
 
-        # Run sync Qdrant call in thread
-        results = await asyncio.to_thread(
-            search_vectors_v2,
-            query,
-            self._client,
-            self._collection_name,
-            self._embedding_fn,
-            k,
-            merged_filters or None,
-            self._using_vector,
-            False,  # verbose off
-        )
+        key = (query, k, json.dumps(merged_filters, sort_keys=True, default=str), self._collection_name)
+        with self._inflight_lock:
+            self.calls += 1
+        while True:
+            with self._inflight_lock:
+                docs = self._cached_result(key)
+                if docs is not None:
+                    self.result_cache_hits += 1
+                    metrics.inc("cache_hits_total", cache="retrieval_result")
+                    return _copy_docs(docs)
+                fut = self._inflight.get(key)
+                leader = fut is None
+                if leader:
+                    fut = self._inflight[key] = Future()
+                else:
+                    self.collapsed += 1
+            if leader:
+                metrics.inc("cache_misses_total", cache="retrieval_result")
+            else:
+                # joined an in-flight computation: neither a hit nor extra retrieval work
+                metrics.inc("cache_coalesced_total", cache="retrieval_result")
+
+            if leader:
+                break
+            try:
+                # shielded: a follower's own cancellation must not cancel the shared future
+                return _copy_docs(await asyncio.shield(asyncio.wrap_future(fut)))
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise  # this caller was cancelled
+                # the leader was cancelled: retry, possibly as the new leader
+
+        try:
+            docs = await self._query_uncached(query, k, merged_filters, on_candidates)
+        except BaseException as e:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            if isinstance(e, asyncio.CancelledError):
+                fut.cancel()  # followers retry instead of inheriting the cancellation
+            else:
+                fut.set_exception(e)
+            raise
+
+        with self._inflight_lock:
+            # cache before leaving in-flight, so no caller slips between the two
+            self.computed += 1
+            if self._result_ttl_s > 0:
+                self._results[key] = (time.monotonic() + self._result_ttl_s, docs)
+                self._results.move_to_end(key)
+                while len(self._results) > self._result_cache_size:
+                    self._results.popitem(last=False)
+            self._inflight.pop(key, None)
+        fut.set_result(docs)
+        return _copy_docs(docs)
+
+    def _cached_result(self, key) -> Optional[List[dict]]:
+        """Unexpired cached docs for key (call with _inflight_lock held)."""
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires, docs = entry
+        if expires < time.monotonic():
+            del self._results[key]
+            return None
+        return docs
+
+    def stats(self) -> Dict[str, int]:
+        """Single-flight counters: collapsed + result_cache_hits calls did no retrieval work."""
+        return {
+            "calls": self.calls,
+            "computed": self.computed,
+            "collapsed": self.collapsed,
+            "result_cache_hits": self.result_cache_hits,
+            "in_flight": len(self._inflight),
+        }
+
+    async def _query_uncached(self, query, k: int, merged_filters: Dict[str, Any], on_candidates=None) -> List[dict]:
+        stats: Dict[str, Any] = {}
+
+        if self._async_client is not None or self._async_client_factory is not None:
+            async_client, semaphore = self._loop_resources()
+            async with semaphore:
+                results = await search_vectors_v2_async(
+                    query,
+                    async_client,
+                    self._collection_name,
+                    self._embedding_fn,
+                    k,
+                    merged_filters or None,
+                    self._using_vector,
+                    case_label_index=self._case_label_index,
+                    adaptive_rerank=self._adaptive_rerank,
+                    stats=stats,
+                    sparse_vector=self._sparse_vector,
+                    executor=self._cpu_executor(),
+                    on_candidates=on_candidates,
+                )
+        else:
+            # Run sync Qdrant call in thread
+            results = await asyncio.to_thread(
+                search_vectors_v2,
+                query,
+                self._client,
+                self._collection_name,
+                self._embedding_fn,
+                k,
+                merged_filters or None,
+                self._using_vector,
+                False,  # verbose off
+                case_label_index=self._case_label_index,
+                adaptive_rerank=self._adaptive_rerank,
+                stats=stats,
+                sparse_vector=self._sparse_vector,
+                on_candidates=on_candidates,
+            )
+
+        return self._to_docs(results, stats)
+
+    def _cpu_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self._cpu_workers, thread_name_prefix="retriever-cpu",
+                    )
+        return self._executor
+
+    def _loop_resources(self):
+        """(async client, concurrency semaphore) bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._bound_loop is not loop:
+            old_client, old_loop = self._async_client, self._bound_loop
+            self._bound_loop = loop
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+            if self._async_client_factory is not None:
+                self._async_client = self._async_client_factory()
+                if old_client is not None:
+                    _close_async_client(old_client, old_loop)
+        return self._async_client, self._semaphore
+
+    def _release(self):
+        """Stop the CPU pool and detach the factory-made async client; returns (client, its loop)."""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if self._async_client_factory is None or self._async_client is None:
+            return None, None
+        client, loop = self._async_client, self._bound_loop
+        self._async_client = self._bound_loop = None
+        return client, loop
+
+    def close(self):
+        """Stop the CPU pool and close the async client (on its own loop when that still runs)."""
+        client, loop = self._release()
+        if client is not None:
+            _close_async_client(client, loop)
+
+    async def aclose(self):
+        """close() from a coroutine; waits for the client to close when it belongs to this loop."""
+        client, loop = self._release()
+        if client is None:
+            return
+        if loop is asyncio.get_running_loop():
+            await client.close()
+        elif loop is not None and loop.is_running():
+            await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(client.close(), loop))
+        else:
+            await _close_quietly(client)
 
+    @staticmethod
+    def _to_docs(results, stats: Dict[str, Any]) -> List[dict]:
         docs = []
         for r in results or []:
             payload = getattr(r, "payload", {}) or {}
@@ -57,9 +277,84 @@ class QdrantRetriever:
                 "score": float(getattr(r, "score", 0.0)),
                 "context": std_context, # Now strictly formatted
                 "payload": payload,
+                "rerank_depth": stats.get("rerank_depth"),
             })
         return docs
 
+    async def query_many(
+        self,
+        questions: List[str],
+        k: int = 3,
+        filters: Optional[Dict[str, Any]] = None,
+    ) -> List[List[dict]]:
+        """
+        Retrieve for many questions with one batched embed, one query_batch_points
+        request, one rerank forward pass and one enrichment pass.
+        Returns one docs list (same shape as query()) per question, in input order.
+        """
+        merged_filters = {**self._static_filters, **(filters or {})}
+        all_results = await asyncio.to_thread(
+            search_vectors_v2_batch,
+            list(questions),
+            self._client,
+            self._collection_name,
+            self._batch_embedding_fn or (lambda qs: [self._embedding_fn(q) for q in qs]),
+            k,
+            merged_filters or None,
+            self._using_vector,
+            case_label_index=self._case_label_index,
+            sparse_vector=self._sparse_vector,
+        )
+        return [self._to_docs(results, {}) for results in all_results]
+
+    def embed_query(self, query: str) -> List[float]:
+        """The query vector used for search (served from the embedding cache when present)."""
+        return self._embedding_fn(query)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed many queries with one batched model call instead of one forward pass each.
+        Falls back to the single-query embedding_fn if no batch function was given.
+        """
+        if self._batch_embedding_fn is None:
+            return [self._embedding_fn(q) for q in queries]
+        return [list(map(float, row)) for row in self._batch_embedding_fn(queries)]
+
+
+def _close_async_client(client: AsyncQdrantClient, loop: Optional[asyncio.AbstractEventLoop]):
+    """
+    Close a client created for `loop`. Its connections belong to that loop, so
+    the close runs there if the loop is still alive; if the loop has already
+    been closed (asyncio.run returned), close() is still awaited on the current
+    loop to release the pool, and errors from the dead transports are ignored.
+    """
+    if loop is not None and not loop.is_closed() and loop.is_running():
+        try:
+            if loop is asyncio.get_running_loop():
+                loop.create_task(client.close())
+                return
+        except RuntimeError:
+            pass  # no running loop in this thread
+        asyncio.run_coroutine_threadsafe(client.close(), loop)
+        return
+
+    try:
+        asyncio.get_running_loop().create_task(_close_quietly(client))
+    except RuntimeError:
+        asyncio.run(_close_quietly(client))
+
+
+async def _close_quietly(client: AsyncQdrantClient):
+    try:
+        await client.close()
+    except Exception:
+        pass  # transports of a closed loop
+
+
+def _copy_docs(docs: List[dict]) -> List[dict]:
+    """Shared results are handed out as copies so one caller can't mutate another's."""
+    return [{**d, "payload": dict(d.get("payload") or {})} for d in docs]
+
 
 def standardize_context(payload: dict) -> str:
     """
@@ -122,6 +417,31 @@ def get_retriever():
             url=os.getenv('QDRANT_URL'),
             api_key=os.getenv('QDRANT_API_KEY'),
         )
-        _retriever = QdrantRetriever(client=_client)
+        def async_client_factory():
+            return AsyncQdrantClient(
+                url=os.getenv('QDRANT_URL'),
+                api_key=os.getenv('QDRANT_API_KEY'),
+            )
+        query_embedder = cached_query_embedder()
+        collection_name = "nomic_text_vectors"
+        _retriever = QdrantRetriever(
+            client=_client,
+            collection_name=collection_name,
+            embedding_fn=query_embedder,
+            batch_embedding_fn=query_embedder.embed_many,
+            # None until `python -m RAG.utils.caseLabelIndex` has been run, or
+            # when it predates the last ingestion (see RAG/utils/postIngest.py)
+            case_label_index=load_case_label_index(
+                default_index_path(collection_name), client=_client, collection_name=collection_name,
+                verify_ingest_version=True,
+            ),
+            adaptive_rerank=os.getenv("ADAPTIVE_RERANK", "0") == "1",
+            # e.g. "bm25" once `python -m RAG.utils.sparseEmbeddings` has been run
+            sparse_vector=os.getenv("HYBRID_SPARSE_VECTOR") or None,
+            async_client_factory=async_client_factory,
+            max_concurrency=int(os.getenv("RETRIEVER_MAX_CONCURRENCY", "32")),
+            cpu_workers=int(os.getenv("RETRIEVER_CPU_WORKERS", "4")),
+            result_ttl_s=float(os.getenv("RETRIEVER_RESULT_TTL_S", "30")),
+        )
 
     return _retriever
\ No newline at end of file
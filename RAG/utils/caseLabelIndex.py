@@ -0,0 +1,169 @@
+"""
+Ingestion-time case label index.
+
+The "Disease Name Short", "Final Diagnosis" and "Vitals" sections are static per
+case, so instead of rediscovering them in Qdrant on every query we build a
+{case id -> labels} mapping once, persist it next to the collection as JSON and
+load it into memory at startup.
+
+The file is stamped with the ingest version (the (:GraphMeta) version that
+RAG/utils/postIngest.py writes after every ingestion, also used by kgCache)
+and the collection's point count at build time. An index whose stamp or count
+no longer matches is rejected at load (retrieval then falls back to fetching
+labels from Qdrant) until it is rebuilt.
+
+Build / refresh after (re-)ingesting a collection (postIngest.py does this):
+
+    python -m RAG.utils.caseLabelIndex --collection nomic_text_vectors
+"""
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchAny
+
+from RAG.utils.kgCache import read_graph_version
+from RAG.utils.queryVectorDB import CASE_LABEL_SECTIONS
+
+logger = logging.getLogger(__name__)
+
+CaseLabels = Dict[str, Dict[str, Optional[str]]]
+
+DEFAULT_INDEX_DIR = Path(__file__).resolve().parents[2] / "data" / "case_label_index"
+
+
+def default_index_path(collection_name: str) -> str:
+    """CASE_LABEL_INDEX_PATH if set, else data/case_label_index/<collection>.json."""
+    return os.getenv("CASE_LABEL_INDEX_PATH") or str(DEFAULT_INDEX_DIR / f"{collection_name}.json")
+
+
+def build_case_label_index(client: QdrantClient, collection_name: str, page_size: int = 1024) -> CaseLabels:
+    """Scroll every label-section point of the collection once and group by case."""
+    index: CaseLabels = {}
+    f = Filter(must=[FieldCondition(key="section", match=MatchAny(any=list(CASE_LABEL_SECTIONS)))])
+
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=f,
+            with_payload=["case", "section", "text"],
+            with_vectors=False,
+            limit=page_size,
+            offset=offset,
+        )
+        for p in points or []:
+            payload = p.payload or {}
+            case_id = payload.get("case")
+            if case_id is None:
+                continue
+            labels = index.setdefault(case_id, {sec: None for sec in CASE_LABEL_SECTIONS})
+            sec = payload.get("section")
+            if labels.get(sec) is None:
+                labels[sec] = payload.get("text")
+        if offset is None:
+            break
+
+    return index
+
+
+def collection_points_count(client: QdrantClient, collection_name: str) -> int:
+    return client.count(collection_name=collection_name, exact=True).count
+
+
+def current_ingest_version() -> Optional[str]:
+    """The ingest version stamped on the graph (None if never stamped)."""
+    from RAG.utils.resources import get_graph
+
+    return read_graph_version(get_graph())
+
+
+def save_case_label_index(index: CaseLabels, path: str, points_count: int, ingest_version: Optional[str]):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.tmp"
+    data = {"ingest_version": ingest_version, "points_count": points_count, "cases": index}
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)  # readers never see a half-written file
+
+
+def rebuild_case_label_index(
+    client: QdrantClient,
+    collection_name: str,
+    ingest_version: Optional[str],
+    path: Optional[str] = None,
+) -> CaseLabels:
+    """Build and persist the index for `ingest_version`; run at the end of every ingestion."""
+    points_count = collection_points_count(client, collection_name)
+    index = build_case_label_index(client, collection_name)
+    save_case_label_index(index, path or default_index_path(collection_name), points_count, ingest_version)
+    return index
+
+
+def load_case_label_index(
+    path: str,
+    client: Optional[QdrantClient] = None,
+    collection_name: Optional[str] = None,
+    verify_ingest_version: bool = False,
+) -> Optional[CaseLabels]:
+    """
+    Return the persisted index, or None if it has not been built yet.
+    With client and collection_name, an index built for a different point count
+    is also rejected with None, and with verify_ingest_version one stamped with
+    another ingest version than current_ingest_version() (i.e. built before the
+    last ingestion, even one that kept the point count).
+    """
+    try:
+        with open(path, encoding="utf-8") as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return None
+
+    if "cases" not in data:
+        logger.warning("Case label index %s predates build stamps; rebuild it", path)
+        return None
+    try:
+        if verify_ingest_version:
+            live_version = current_ingest_version()
+            if live_version != data.get("ingest_version"):
+                logger.warning(
+                    "Case label index %s is stale (built for ingest version %s, current is %s); rebuild it",
+                    path, data.get("ingest_version"), live_version,
+                )
+                return None
+        if client is not None and collection_name is not None:
+            live_count = collection_points_count(client, collection_name)
+            if live_count != data.get("points_count"):
+                logger.warning(
+                    "Case label index %s is stale (built for %s points, %s has %s); rebuild it",
+                    path, data.get("points_count"), collection_name, live_count,
+                )
+                return None
+    except Exception as e:
+        logger.warning("Could not verify case label index %s: %s", path, e)
+        return None
+    return data["cases"]
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Build the case label index for a Qdrant collection.")
+    parser.add_argument("--collection", default="nomic_text_vectors")
+    parser.add_argument("--out", default=None, help="output path (default: CASE_LABEL_INDEX_PATH or data/case_label_index/)")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    path = args.out or default_index_path(args.collection)
+    ingest_version = current_ingest_version()
+    index = rebuild_case_label_index(client, args.collection, ingest_version, path)
+    print(f"Indexed labels for {len(index)} cases (ingest version {ingest_version}) -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from RAG.utils.embeddings import MATRYOSHKA_DIM, embed_nomic_texts, embedding_model_id
+from RAG.utils.metrics import metrics
+
+
+def normalize_text(text: str) -> str:
+    """
+    Collapse whitespace and case so trivially different questions share a key.
+    The Nomic tokenizer is bert-base-uncased, so lowercasing does not change the vector.
+    """
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache with an in-memory LRU tier and an optional
+    SQLite tier on disk.
+
+    Keys are sha256(model id, task prefix, matryoshka dim, normalized text), so
+    entries from another model or dim can never be served by mistake.
+    Instances are callable with a single text, which makes them a drop-in
+    `embedding_fn` for QdrantRetriever / search_vectors_v2.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable = embed_nomic_texts,
+        model_id: str = None,
+        task_type: str = "search_query",
+        matryoshka_dim: int = MATRYOSHKA_DIM,
+        max_items: int = 4096,
+        db_path: Optional[str] = None,
+        max_disk_items: int = 200_000,
+    ):
+        self._embed_fn = embed_fn
+        self._model_id = model_id or embedding_model_id()
+        self._task_type = task_type
+        self._dim = matryoshka_dim
+        self._max_items = max_items
+        self._max_disk_items = max_disk_items
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+            self._db.commit()
+
+    # ---- keys ----------------------------------------------------------------
+
+    def key(self, text: str) -> str:
+        raw = f"{self._model_id}\x1f{self._task_type}\x1f{self._dim}\x1f{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # ---- tiers ---------------------------------------------------------------
+
+    def _memory_get(self, key: str) -> Optional[np.ndarray]:
+        vec = self._memory.get(key)
+        if vec is not None:
+            self._memory.move_to_end(key)
+        return vec
+
+    def _memory_put(self, key: str, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_items:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT vec FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32).copy()
+
+    def _disk_touch(self, keys: List[str]):
+        """Bump last_used of disk hits in one short write transaction."""
+        if self._db is None or not keys:
+            return
+        self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(time.time(), k) for k in keys])
+        self._db.commit()
+
+    def _disk_put_many(self, items, touched: List[str] = ()):
+        """Insert new rows (and bump last_used of this call's disk hits) in one transaction."""
+        if self._db is None or not (items or touched):
+            return
+        now = time.time()
+        self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in touched])
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vec, last_used) VALUES (?, ?, ?)",
+            [(k, v.astype(np.float32).tobytes(), now) for k, v in items],
+        )
+        # size-bounded: drop the least recently used rows beyond the limit
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        if count > self._max_disk_items:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (count - self._max_disk_items,),
+            )
+        self._db.commit()
+
+    # ---- public API ----------------------------------------------------------
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, computing only the cache misses in one batched call."""
+        out = np.empty((len(texts), self._dim), dtype=np.float32)
+        missing = {}  # key -> list of row indexes (dedupes repeats within the batch)
+        touched = []  # disk hits whose last_used still has to be written
+
+        with self._lock:
+            for i, text in enumerate(texts):
+                k = self.key(text)
+                vec = self._memory_get(k)
+                if vec is not None:
+                    self.hits += 1
+                else:
+                    vec = self._disk_get(k)
+                    if vec is not None:
+                        self.disk_hits += 1
+                        self._memory_put(k, vec)
+                        touched.append(k)
+                if vec is not None:
+                    out[i] = vec
+                else:
+                    missing.setdefault(k, []).append(i)
+
+        metrics.inc("cache_hits_total", len(texts) - sum(map(len, missing.values())), cache="embedding")
+        if not missing:
+            with self._lock:
+                self._disk_touch(touched)
+            return out
+
+        keys = list(missing)
+        metrics.inc("cache_misses_total", len(keys), cache="embedding")
+        to_embed = [texts[missing[k][0]] for k in keys]
+        vectors = np.asarray(
+            self._embed_fn(to_embed, task_type=self._task_type, matryoshka_dim=self._dim),
+            dtype=np.float32,
+        )
+
+        with self._lock:
+            self.misses += len(keys)
+            for k, vec in zip(keys, vectors):
+                self._memory_put(k, vec)
+                out[missing[k]] = vec
+            self._disk_put_many(list(zip(keys, vectors)), touched)
+
+        return out
+
+    def __call__(self, text: str) -> List[float]:
+        return self.embed_many([text])[0].tolist()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_items": len(self._memory),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def cached_query_embedder(db_path: Optional[str] = None) -> EmbeddingCache:
+    """
+    Query embedder used by get_retriever(). The disk tier is enabled when
+    EMBEDDING_CACHE_PATH is set (or db_path is passed).
+    """
+    return EmbeddingCache(
+        task_type="search_query",
+        db_path=db_path or os.getenv("EMBEDDING_CACHE_PATH"),
+    )
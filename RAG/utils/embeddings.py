@@ -1,31 +1,139 @@
-import torch
-import torch.nn.functional as F
-from transformers import AutoTokenizer, AutoModel
+import os
+import threading
 
-# Device selection
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+import numpy as np
 
+from RAG.utils.metrics import metrics
 
-# Load Nomic embed model + tokenizer
-# Note: tokenizer is BERT-based as per Nomic docs
-tokenizer = AutoTokenizer.from_pretrained(
-    "bert-base-uncased",
-    model_max_length=8192,        # supports long context
-)
+NOMIC_MODEL_ID = "nomic-ai/nomic-embed-text-v1.5"
+TOKENIZER_ID = "bert-base-uncased"
 
-model = AutoModel.from_pretrained(
-    "nomic-ai/nomic-embed-text-v1.5",
-    trust_remote_code=True,
-    rotary_scaling_factor=2,      # recommended in README
-)
-model.to(device)
-model.eval()
+# Inference backend, selectable via EMBEDDING_BACKEND:
+#   - 'torch' : fp32 PyTorch model (default, uses GPU when available)
+#   - 'int8'  : PyTorch with dynamic int8 quantization of Linear layers (CPU)
+#   - 'onnx'  : ONNX Runtime on CPU, exported once and int8-quantized
+#               (set EMBEDDING_ONNX_QUANTIZE=0 to keep the fp32 export)
+BACKENDS = ("torch", "int8", "onnx")
+DEFAULT_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
 
 MATRYOSHKA_DIM = 768  # you can set 768, 512, 256, ... depending on your needs
+BATCH_SIZE = 32       # texts per forward pass in embed_nomic_texts
+
+
+class _NomicModelHolder:
+    """
+    Lazily loads the Nomic tokenizer + model on first use.
+
+    Nothing heavy (torch, transformers, weights) is touched at import time, so
+    modules that only import this one don't pay the model startup cost.
+    """
+
+    def __init__(self, backend: str = DEFAULT_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._tokenizer = None
+        self._model = None
+        self._device = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self):
+        """Return (tokenizer, model, device), loading them once if needed."""
+        if self._model is None:
+            with self._lock:
+                # double-checked: another thread may have loaded while we waited
+                if self._model is None:
+                    self._load()
+        return self._tokenizer, self._model, self._device
+
+    def _load(self):
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+
+        # Device selection (quantized backends are CPU-only)
+        if self.backend == "torch" and torch.cuda.is_available():
+            device = torch.device("cuda")
+        else:
+            device = torch.device("cpu")
+
+        # Note: tokenizer is BERT-based as per Nomic docs
+        tokenizer = AutoTokenizer.from_pretrained(
+            TOKENIZER_ID,
+            model_max_length=8192,        # supports long context
+        )
+
+        def load_hf_model():
+            model = AutoModel.from_pretrained(
+                NOMIC_MODEL_ID,
+                trust_remote_code=True,
+                rotary_scaling_factor=2,      # recommended in README
+            )
+            model.to(device)
+            model.eval()
+            return model
+
+        if self.backend == "onnx":
+            # the HF model is only built if the .onnx file still has to be exported
+            from RAG.utils.onnxEmbeddings import load_onnx_model
+            quantize = os.getenv("EMBEDDING_ONNX_QUANTIZE", "1") != "0"
+            model = load_onnx_model(load_hf_model, tokenizer, NOMIC_MODEL_ID, quantize=quantize)
+        else:
+            model = load_hf_model()
+            if self.backend == "int8":
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        self._tokenizer, self._device = tokenizer, device
+        self._model = model  # assigned last: it is the "loaded" flag
+
+    def unload(self):
+        """Drop the model so its memory can be reclaimed; the next embed reloads it."""
+        with self._lock:
+            if self._model is None:
+                return
+            device = self._device
+            self._tokenizer = self._model = self._device = None
+
+        if device is not None and device.type == "cuda":
+            import torch
+            torch.cuda.empty_cache()
+
+
+_holders = {}
+_holders_lock = threading.Lock()
+
+
+def _get_holder(backend: str = None) -> _NomicModelHolder:
+    backend = backend or DEFAULT_BACKEND
+    holder = _holders.get(backend)
+    if holder is None:
+        with _holders_lock:
+            holder = _holders.setdefault(backend, _NomicModelHolder(backend))
+    return holder
+
+
+def embedding_model_id(backend: str = None) -> str:
+    """Model id including the backend, e.g. for cache keys."""
+    return f"{NOMIC_MODEL_ID}:{backend or DEFAULT_BACKEND}"
+
+
+def warmup(backend: str = None):
+    """Load the model now (e.g. at worker start) instead of on the first query."""
+    _get_holder(backend).get()
+
+
+def unload(backend: str = None):
+    """Release the model; safe to call when it was never loaded."""
+    _get_holder(backend).unload()
 
 
 def _mean_pooling(model_output, attention_mask):
     """Standard mean pooling over token embeddings."""
+    import torch
+
     token_embeddings = model_output[0]  # (batch, seq_len, hidden)
     input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
     summed = torch.sum(token_embeddings * input_mask_expanded, dim=1)
@@ -33,6 +141,64 @@ def _mean_pooling(model_output, attention_mask):
     return summed / counts
 
 
+@metrics.timed("embed")
+def embed_nomic_texts(texts,
+                      task_type: str = "search_query",
+                      matryoshka_dim: int = MATRYOSHKA_DIM,
+                      batch_size: int = BATCH_SIZE,
+                      backend: str = None) -> np.ndarray:
+    """
+    Embed many texts into Nomic v1.5 space.
+
+    Texts are sorted by length so each micro-batch is padded only to its own
+    longest member, then written back in input order.
+    backend overrides EMBEDDING_BACKEND for this call (see BACKENDS).
+    Returns a contiguous float32 array of shape (len(texts), matryoshka_dim).
+    """
+    texts = list(texts)
+    out = np.empty((len(texts), matryoshka_dim), dtype=np.float32)
+    if not texts:
+        return out
+
+    import torch
+    import torch.nn.functional as F
+
+    metrics.inc("texts_embedded_total", len(texts))
+    tokenizer, model, device = _get_holder(backend).get()
+
+    # Prefix is important for Nomic (it affects behavior)
+    sentences = [f"{task_type}: {t}" for t in texts]
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]))
+
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = tokenizer(
+                [sentences[i] for i in idx],
+                padding=True,
+                truncation=True,
+                return_tensors="pt",
+            ).to(device)
+
+            output = model(**encoded)
+
+            # 1) Mean pooling
+            emb = _mean_pooling(output, encoded["attention_mask"])
+
+            # 2) Optional: layer norm
+            emb = F.layer_norm(emb, normalized_shape=(emb.shape[1],))
+
+            # 3) Matryoshka: cut to desired dim (768 → 512/256/...)
+            emb = emb[:, :matryoshka_dim]
+
+            # 4) L2-normalize
+            emb = F.normalize(emb, p=2, dim=1)
+
+            out[idx] = emb.float().cpu().numpy()
+
+    return out
+
+
 def embed_nomic_text(text: str,
                      task_type: str = "search_query",
                      matryoshka_dim: int = MATRYOSHKA_DIM):
@@ -44,34 +210,16 @@ def embed_nomic_text(text: str,
       - 'search_document' for documents
       - 'clustering', 'classification', ... also supported
     """
-    # Prefix is important for Nomic (it affects behavior)
-    sentence = f"{task_type}: {text}"
-
-    encoded = tokenizer(
-        [sentence],
-        padding=True,
-        truncation=True,
-        return_tensors="pt",
-    ).to(device)
-
-    with torch.no_grad():
-        output = model(**encoded)
-
-    # 1) Mean pooling
-    emb = _mean_pooling(output, encoded["attention_mask"])
-
-    # 2) Optional: layer norm
-    emb = F.layer_norm(emb, normalized_shape=(emb.shape[1],))
-
-    # 3) Matryoshka: cut to desired dim (768 → 512/256/...)
-    emb = emb[:, :matryoshka_dim]
-
-    # 4) L2-normalize
-    emb = F.normalize(emb, p=2, dim=1)
+    emb = embed_nomic_texts([text], task_type=task_type, matryoshka_dim=matryoshka_dim)
 
     # Return as 1D list (similar to your CLIP function)
-    return emb[0].cpu().tolist()
+    return emb[0].tolist()
 
 
 def embed_text_query(query: str):
-    return embed_nomic_text(query, task_type="search_query")
\ No newline at end of file
+    return embed_nomic_text(query, task_type="search_query")
+
+
+def embed_text_queries(queries) -> np.ndarray:
+    """Batched counterpart of embed_text_query: one row per query, in input order."""
+    return embed_nomic_texts(queries, task_type="search_query")
@@ -0,0 +1,215 @@
+"""
+In-process cache in front of get_cases_knowledge_graph.
+
+Case nodes and their neighbors only change when the graph is re-ingested, so
+per-case results are kept in an LRU keyed by case id and only missing ids are
+fetched (in one Cypher call). Ingestion writes a version stamp on a
+(:GraphMeta) node; when the stamp changes the cache is dropped, and results of
+fetches that were already in flight at that point are not cached.
+
+After re-ingesting the graph (RAG/utils/postIngest.py does this together with
+the other post-ingestion steps):
+
+    python -m RAG.utils.kgCache --bump-version
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from RAG.utils.metrics import metrics
+from RAG.utils.queryVectorDB import CaseKnowledge, fetch_case_knowledge
+
+GRAPH_META_KEY = "trinds"
+
+READ_VERSION_QUERY = """
+MATCH (m:GraphMeta {key: $key})
+RETURN m.version AS version
+"""
+
+WRITE_VERSION_QUERY = """
+MERGE (m:GraphMeta {key: $key})
+SET m.version = $version, m.updated_at = datetime()
+RETURN m.version AS version
+"""
+
+_MISSING: CaseKnowledge = {"has_info": False}
+
+
+def read_graph_version(graph) -> Optional[str]:
+    records = graph.query(READ_VERSION_QUERY, {"key": GRAPH_META_KEY})
+    return records[0]["version"] if records else None
+
+
+def write_graph_version(graph, version: Optional[str] = None) -> str:
+    """Stamp the graph with a new version; call at the end of every ingestion."""
+    version = version or f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    graph.query(WRITE_VERSION_QUERY, {"key": GRAPH_META_KEY, "version": version})
+    return version
+
+
+class CaseKnowledgeCache:
+    """
+    LRU of {case id -> CaseKnowledge}, usable wherever get_cases_knowledge_graph
+    expects a graph (it exposes fetch_case_knowledge).
+
+    - Cases absent from the graph are cached too, so they aren't re-queried.
+    - The version stamp is re-read at most every version_check_s seconds.
+    - With snapshot_path, entries are persisted as JSON (tagged with the graph
+      version) and reloaded on the next start if the version still matches.
+    """
+
+    def __init__(
+        self,
+        graph,
+        max_items: int = 4096,
+        snapshot_path: Optional[str] = None,
+        version_check_s: float = 30.0,
+    ):
+        self._graph = graph
+        self._max_items = max_items
+        self._snapshot_path = snapshot_path
+        self._version_check_s = version_check_s
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CaseKnowledge]" = OrderedDict()
+        self._version: Optional[str] = None
+        self._version_checked_at = float("-inf")
+        self._snapshot_loaded = False
+        self._generation = 0  # bumped on every clear
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # ---- versioning ----------------------------------------------------------
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._version_checked_at < self._version_check_s:
+            return
+        version = read_graph_version(self._graph)
+        with self._lock:
+            self._version_checked_at = now
+            if not self._snapshot_loaded:
+                self._snapshot_loaded = True
+                self._load_snapshot(version)
+            if version != self._version:
+                if self._version is not None:
+                    self.invalidations += 1
+                    self._entries.clear()
+                    self._generation += 1
+                self._version = version
+
+    def invalidate(self):
+        """Drop everything now (e.g. right after an ingestion in the same process)."""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._version_checked_at = float("-inf")
+            self.invalidations += 1
+
+    # ---- snapshot ------------------------------------------------------------
+
+    def _load_snapshot(self, version: Optional[str]):
+        if not self._snapshot_path or version is None:
+            return
+        try:
+            with open(self._snapshot_path, encoding="utf-8") as fh:
+                snap = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if snap.get("version") != version:
+            return  # stale: written for an older graph
+        for cid, info in snap.get("cases", {}).items():
+            self._entries[int(cid)] = info
+        self._version = version
+
+    def save_snapshot(self):
+        if not self._snapshot_path:
+            return
+        with self._lock:
+            snap = {"version": self._version, "cases": {str(k): v for k, v in self._entries.items()}}
+        Path(self._snapshot_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{self._snapshot_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(snap, fh, ensure_ascii=False)
+        os.replace(tmp, self._snapshot_path)
+
+    # ---- lookups -------------------------------------------------------------
+
+    def fetch_case_knowledge(self, ids: List[int]) -> Dict[int, CaseKnowledge]:
+        """Same contract as queryVectorDB.fetch_case_knowledge, served from memory when possible."""
+        self._check_version()
+
+        found: Dict[int, CaseKnowledge] = {}
+        missing = []
+        with self._lock:
+            generation = self._generation
+            for cid in dict.fromkeys(ids):
+                info = self._entries.get(cid)
+                if info is None:
+                    missing.append(cid)
+                    continue
+                self._entries.move_to_end(cid)
+                if info.get("has_info"):
+                    found[cid] = info
+            self.hits += len(set(ids)) - len(missing)
+            self.misses += len(missing)
+        metrics.inc("cache_hits_total", len(set(ids)) - len(missing), cache="knowledge_graph")
+        metrics.inc("cache_misses_total", len(missing), cache="knowledge_graph")
+
+        if missing:
+            fetched = fetch_case_knowledge(self._graph, missing)
+            with self._lock:
+                # an invalidation during the fetch means it may have read the old graph
+                cache = generation == self._generation
+                for cid in missing:
+                    info = fetched.get(cid, _MISSING)
+                    if cache:
+                        self._entries[cid] = info
+                        self._entries.move_to_end(cid)
+                    if info.get("has_info"):
+                        found[cid] = info
+                while len(self._entries) > self._max_items:
+                    self._entries.popitem(last=False)
+
+        return found
+
+    def query(self, query, params=None):
+        """Pass-through for callers that run raw Cypher against the wrapped graph."""
+        return self._graph.query(query, params or {})
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "items": len(self._entries),
+            "version": self._version,
+        }
+
+
+def main():
+    from dotenv import load_dotenv
+    from RAG.utils.resources import get_graph
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Knowledge-graph cache maintenance.")
+    parser.add_argument("--bump-version", action="store_true", help="write a new graph version stamp")
+    args = parser.parse_args()
+
+    graph = get_graph()
+    if args.bump_version:
+        print(f"Graph version -> {write_graph_version(graph)}")
+    else:
+        print(f"Graph version: {read_graph_version(graph)}")
+
+
+if __name__ == "__main__":
+    main()
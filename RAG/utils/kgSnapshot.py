@@ -0,0 +1,180 @@
+"""
+Columnar snapshot of the Case -> neighbor subgraph, usable instead of Neo4j.
+
+The exporter dumps exactly what CASE_KNOWLEDGE_QUERY reads into one .npz file:
+CSR adjacency (indptr over cases, edges sorted by case then relationship) with
+relationship codes and value ids into a deduplicated string table. The reader
+answers that query (and the graph version query used by CaseKnowledgeCache)
+with array indexing, so the hybrid RAG can run on edge boxes and in tests
+without a live graph. Set KG_SNAPSHOT_PATH to make the resource registry use it.
+
+    python -m RAG.utils.kgSnapshot --out data/kg_snapshot.npz
+"""
+import argparse
+from itertools import groupby
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from RAG.utils.queryVectorDB import CASE_KNOWLEDGE_QUERY, KG_RELATIONS
+from RAG.utils.kgCache import READ_VERSION_QUERY, read_graph_version
+
+EXPORT_QUERY = """
+MATCH (c:Case)
+OPTIONAL MATCH (c)-[r:HAS_INFO|HAS_SYMPTOM|LOCATED_IN|OF_DISEASE|HAS_RISK_FACTOR|HAS_INVESTIGATION|HAS_EPIDEMIOLOGY]->(neighbor)
+RETURN
+    coalesce(c.case_id, c.file_id) AS id,
+    c.case_id AS case_id,
+    c.file_id AS file_id,
+    type(r) AS rel,
+    CASE
+        WHEN type(r) IN ['HAS_SYMPTOM', 'LOCATED_IN', 'OF_DISEASE'] THEN neighbor.name
+        ELSE coalesce(neighbor.content, neighbor.name)
+    END AS val
+"""
+
+REL_NAMES: List[str] = list(KG_RELATIONS)
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _encode_strings(strings: List[str]):
+    blobs = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    return np.frombuffer(b"".join(blobs), dtype=np.uint8), offsets
+
+
+def _decode_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = blob.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def export_kg_snapshot(graph, path: str) -> Dict[str, int]:
+    """Dump the Case -> neighbor subgraph of `graph` to `path` (.npz)."""
+    records = graph.query(EXPORT_QUERY)
+    version = read_graph_version(graph) or ""
+
+    # case row -> [(rel code, value id)]
+    rows: Dict[Any, int] = {}
+    row_ids: List[int] = []
+    lookup: Dict[int, int] = {}
+    edges: List[List[tuple]] = []
+    string_ids: Dict[str, int] = {}
+
+    for rec in records:
+        rid = _as_int(rec["id"])
+        if rid is None:
+            continue
+        row = rows.get(rid)
+        if row is None:
+            row = rows[rid] = len(row_ids)
+            row_ids.append(rid)
+            edges.append([])
+        # the live query matches either property
+        for key in (rec.get("case_id"), rec.get("file_id")):
+            key = _as_int(key)
+            if key is not None:
+                lookup.setdefault(key, row)
+
+        rel, val = rec.get("rel"), rec.get("val")
+        if rel in KG_RELATIONS and val is not None:
+            edges[row].append((REL_NAMES.index(rel), string_ids.setdefault(val, len(string_ids))))
+
+    indptr = np.zeros(len(row_ids) + 1, dtype=np.int64)
+    rel_codes, val_ids = [], []
+    for row, row_edges in enumerate(edges):
+        row_edges.sort(key=lambda e: e[0])  # stable: keeps value order within a relationship
+        rel_codes.extend(e[0] for e in row_edges)
+        val_ids.extend(e[1] for e in row_edges)
+        indptr[row + 1] = len(rel_codes)
+
+    blob, offsets = _encode_strings(list(string_ids))
+    keys = np.array(sorted(lookup), dtype=np.int64)
+    np.savez_compressed(
+        path,
+        version=np.array(version),
+        rel_names=np.array(REL_NAMES),
+        row_ids=np.array(row_ids, dtype=np.int64),
+        lookup_keys=keys,
+        lookup_rows=np.array([lookup[k] for k in keys], dtype=np.int64),
+        indptr=indptr,
+        rels=np.array(rel_codes, dtype=np.uint8),
+        vals=np.array(val_ids, dtype=np.int32),
+        string_blob=blob,
+        string_offsets=offsets,
+    )
+    return {"cases": len(row_ids), "edges": len(rel_codes), "strings": len(string_ids)}
+
+
+class KnowledgeGraphSnapshot:
+    """
+    Read-only stand-in for Neo4jGraph, answering the Cypher that
+    get_cases_knowledge_graph / CaseKnowledgeCache send, from a snapshot file.
+    """
+
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.version = str(data["version"]) or None
+            self._rel_names = [str(r) for r in data["rel_names"]]
+            self._row_ids = data["row_ids"]
+            self._lookup_keys = data["lookup_keys"]
+            self._lookup_rows = data["lookup_rows"]
+            self._indptr = data["indptr"]
+            self._rels = data["rels"]
+            self._vals = data["vals"]
+            self._strings = _decode_strings(data["string_blob"], data["string_offsets"])
+
+    def _rows_for(self, ids) -> List[int]:
+        keys = np.array([k for k in (_as_int(i) for i in ids) if k is not None], dtype=np.int64)
+        pos = np.searchsorted(self._lookup_keys, keys)
+        pos = pos[pos < len(self._lookup_keys)]
+        hit = pos[np.isin(self._lookup_keys[pos], keys)]
+        return list(dict.fromkeys(self._lookup_rows[hit].tolist()))
+
+    def _case_record(self, row: int) -> Dict[str, Any]:
+        lo, hi = self._indptr[row], self._indptr[row + 1]
+        rels, vals = self._rels[lo:hi].tolist(), self._vals[lo:hi].tolist()
+        groups = []
+        start = 0
+        for code, run in groupby(rels):
+            n = len(list(run))
+            groups.append({
+                "rel": self._rel_names[code],
+                "vals": [self._strings[v] for v in vals[start:start + n]],
+            })
+            start += n
+        return {"id": int(self._row_ids[row]), "groups": groups}
+
+    def query(self, query: str, params: Optional[dict] = None) -> List[Dict[str, Any]]:
+        params = params or {}
+        if query == CASE_KNOWLEDGE_QUERY:
+            return [self._case_record(row) for row in self._rows_for(params.get("ids", []))]
+        if query == READ_VERSION_QUERY:
+            return [{"version": self.version}] if self.version else []
+        first_line = next((line.strip() for line in query.splitlines() if line.strip()), "")
+        raise ValueError(
+            f"KnowledgeGraphSnapshot only answers the case knowledge and version queries, got: {first_line[:80]!r}"
+        )
+
+
+def main():
+    from dotenv import load_dotenv
+    from RAG.utils.resources import resources
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Export the Case subgraph from Neo4j to a columnar snapshot.")
+    parser.add_argument("--out", default="data/kg_snapshot.npz")
+    args = parser.parse_args()
+
+    counts = export_kg_snapshot(resources.neo4j_graph, args.out)
+    print(f"Exported {counts['cases']} cases, {counts['edges']} edges, {counts['strings']} strings -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Sampled debug dumps for the hot retrieval / generation paths.
+
+Full hit payloads, concatenated contexts and raw model responses are only
+formatted when the module's logger is enabled for DEBUG, and then only for a
+DEBUG_DUMP_SAMPLE fraction of calls (default 1.0 = every call), so a
+production process at INFO pays one level check per call and nothing else:
+
+    LOG_LEVEL=DEBUG DEBUG_DUMP_SAMPLE=0.01 python -m Generate_Response.server
+"""
+import logging
+import os
+import random
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def should_dump(logger: logging.Logger) -> bool:
+    """True if this call should emit its debug dump (DEBUG enabled and sampled in)."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return False
+    rate = float(os.getenv("DEBUG_DUMP_SAMPLE", "1.0"))
+    return rate >= 1.0 or random.random() < rate
+
+
+def configure_logging(level: str = None):
+    """basicConfig for the entry points; level defaults to LOG_LEVEL (WARNING)."""
+    logging.basicConfig(level=(level or os.getenv("LOG_LEVEL", "WARNING")).upper(), format=LOG_FORMAT)
+
+
+_verbose_handler = logging.StreamHandler()
+_verbose_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+
+def log_verbose(logger: logging.Logger, msg: str, *args):
+    """
+    Emit an INFO record the caller explicitly asked for (verbose=True).
+    If the application's logging would show it, it goes through `logger` as
+    usual; otherwise (e.g. under the default WARNING level) this one record is
+    written straight to stderr, leaving logger levels and handlers untouched.
+    """
+    if logger.isEnabledFor(logging.INFO) and logger.hasHandlers():
+        logger.info(msg, *args, stacklevel=2)
+        return
+    record = logger.makeRecord(logger.name, logging.INFO, "(verbose)", 0, msg, args, None)
+    _verbose_handler.handle(record)
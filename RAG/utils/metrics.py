@@ -0,0 +1,176 @@
+"""
+In-process latency and counter metrics for the retrieval / generation pipeline.
+
+Always on and cheap (a perf_counter pair and a locked dict update per span), so
+a slow diagnosis can be broken down by stage without LangSmith:
+
+    from RAG.utils.metrics import metrics
+
+    with metrics.span("rerank"):
+        ...
+
+    @metrics.timed("knowledge_graph")   # sync or async functions
+    def get_cases_knowledge_graph(...): ...
+
+    metrics.inc("candidates_reranked_total", depth)
+    metrics.inc("cache_hits_total", hits, cache="embedding")
+
+Cache counters are cache_hits_total / cache_misses_total per cache label;
+retrievals that joined an identical in-flight one are counted separately as
+cache_coalesced_total{cache="retrieval_result"}.
+
+Span durations land in one histogram, trinds_stage_seconds{stage=...}.
+Export with metrics.to_prometheus() (text exposition format, served on
+/metrics by Generate_Response/server.py) or metrics.to_json(), which also
+carries p50/p95/p99 over the most recent samples of each stage.
+"""
+import bisect
+import functools
+import inspect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+PREFIX = "trinds_"
+STAGE_HISTOGRAM = "stage_seconds"
+# seconds; spans range from sub-ms cache lookups to multi-second LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RECENT_SAMPLES = 1024
+INF_BUCKET = 'le="+Inf"'
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Histogram:
+    __slots__ = ("bucket_counts", "count", "total", "recent")
+
+    def __init__(self, n_buckets: int):
+        self.bucket_counts = [0] * n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+
+class MetricsRegistry:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not value:
+            return
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = _Histogram(len(self.buckets))
+            if i < len(self.buckets):
+                h.bucket_counts[i] += 1
+            h.count += 1
+            h.total += value
+            h.recent.append(value)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Time the block into stage_seconds{stage=...} (recorded on errors too)."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(STAGE_HISTOGRAM, time.perf_counter() - t0, stage=stage)
+
+    def timed(self, stage: str):
+        """Decorator form of span(); works on plain and async functions."""
+        def decorate(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(stage):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, h.count, h.total, sorted(h.recent)) for key, h in self._histograms.items()]
+
+        def pct(samples, q):
+            return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else None
+
+        return {
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+            "histograms": [
+                {
+                    "name": name, "labels": dict(labels), "count": count, "sum": total,
+                    "mean": total / count if count else None,
+                    "p50": pct(recent, 0.50), "p95": pct(recent, 0.95), "p99": pct(recent, 0.99),
+                }
+                for (name, labels), count, total, recent in histograms
+            ],
+        }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                ((key, list(h.bucket_counts), h.count, h.total) for key, h in self._histograms.items()),
+                key=lambda item: item[0],
+            )
+
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            metric = PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+        for (name, labels), bucket_counts, count, total in histograms:
+            metric = PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(self.buckets, bucket_counts):
+                cumulative += n
+                le = 'le="%g"' % bound
+                lines.append(f"{metric}_bucket{_format_labels(labels, le)} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, INF_BUCKET)} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
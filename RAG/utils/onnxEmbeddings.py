@@ -0,0 +1,108 @@
+import os
+from pathlib import Path
+from typing import Callable
+
+DEFAULT_ONNX_DIR = os.path.join(Path.home(), ".cache", "trinds", "onnx")
+ONNX_OPSET = 17
+
+
+def _write_atomically(path: str, write: Callable[[str], None]):
+    """Run write(tmp path) next to path, then move the finished file into place."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        write(tmp)
+        os.replace(tmp, path)  # readers see the old state or the complete file, never a partial one
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def export_onnx(model, tokenizer, path: str):
+    """
+    Export the (CPU, fp32) Nomic model to ONNX with dynamic batch / sequence axes.
+    Only the last hidden state is exported; pooling stays in embeddings.py.
+    """
+    import torch
+
+    sample = tokenizer(["search_query: warm up"], return_tensors="pt")
+    input_names = [name for name in ("input_ids", "token_type_ids", "attention_mask") if name in sample]
+
+    def write(tmp: str):
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            tmp,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=ONNX_OPSET,
+        )
+
+    with torch.inference_mode():
+        _write_atomically(path, write)
+
+
+def quantize_onnx(src: str, dst: str):
+    """Dynamic int8 weight quantization of an exported model (activations stay fp32)."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    _write_atomically(dst, lambda tmp: quantize_dynamic(src, tmp, weight_type=QuantType.QInt8))
+
+
+class OnnxNomicModel:
+    """
+    onnxruntime session exposed with the same call shape as the HF model:
+    `model(**encoded)[0]` is the (batch, seq_len, hidden) token embedding tensor.
+    """
+
+    def __init__(self, path: str, num_threads: int = 0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._input_names = [i.name for i in self._session.get_inputs()]
+
+    def __call__(self, **encoded):
+        import torch
+
+        feeds = {name: encoded[name].cpu().numpy() for name in self._input_names}
+        (hidden,) = self._session.run(["last_hidden_state"], feeds)
+        return (torch.from_numpy(hidden),)
+
+
+def load_onnx_model(load_model, tokenizer, model_id: str, quantize: bool = True,
+                    onnx_dir: str = None) -> OnnxNomicModel:
+    """
+    Return an ONNX runner for the model, exporting (and quantizing) it on first use.
+    The files are cached under onnx_dir (EMBEDDING_ONNX_DIR), so later processes
+    skip the export. load_model() builds the fp32 HF model and is only called
+    when an export is needed; the torch model is dropped right after it, so a
+    process serving from the cached file never holds the torch weights.
+    Exports are written to a temp file and renamed into place under a file
+    lock, so concurrent workers export once and never load a partial file.
+    """
+    onnx_dir = onnx_dir or os.getenv("EMBEDDING_ONNX_DIR", DEFAULT_ONNX_DIR)
+    stem = model_id.replace("/", "__")
+    fp32_path = os.path.join(onnx_dir, f"{stem}.onnx")
+    int8_path = os.path.join(onnx_dir, f"{stem}.int8.onnx")
+    path = int8_path if quantize else fp32_path
+
+    if not os.path.exists(path):
+        from filelock import FileLock  # installed with transformers / huggingface_hub
+
+        os.makedirs(onnx_dir, exist_ok=True)
+        with FileLock(os.path.join(onnx_dir, f"{stem}.lock")):
+            # another worker may have finished the export while we waited
+            if not os.path.exists(fp32_path):
+                export_onnx(load_model(), tokenizer, fp32_path)
+            if quantize and not os.path.exists(int8_path):
+                quantize_onnx(fp32_path, int8_path)
+
+    return OnnxNomicModel(path, num_threads=int(os.getenv("EMBEDDING_ONNX_THREADS", "0")))
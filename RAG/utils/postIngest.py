@@ -0,0 +1,62 @@
+"""
+Steps to run once an ingestion into Qdrant and/or Neo4j has finished, so the
+caches derived from that data pick it up:
+
+- write a new ingest version on the (:GraphMeta) node, which makes every
+  CaseKnowledgeCache (RAG/utils/kgCache.py) drop its entries on its next
+  version check and every case label index built before it stale;
+- rebuild the case label index of the collection (RAG/utils/caseLabelIndex.py)
+  stamped with that version.
+
+Call finalize_ingestion() at the end of an ingestion script, or:
+
+    python -m RAG.utils.postIngest --collection nomic_text_vectors
+"""
+import argparse
+import os
+from typing import Dict, Optional
+
+from RAG.utils.caseLabelIndex import default_index_path, rebuild_case_label_index
+from RAG.utils.kgCache import write_graph_version
+
+
+def finalize_ingestion(
+    graph,
+    client=None,
+    collection_name: str = "nomic_text_vectors",
+    index_path: Optional[str] = None,
+) -> Dict[str, object]:
+    """
+    Bump the ingest version on `graph` (the live Neo4j graph) and, with a Qdrant
+    client, rebuild the collection's case label index for that version.
+    """
+    version = write_graph_version(graph)
+    done: Dict[str, object] = {"ingest_version": version}
+    if client is not None:
+        path = index_path or default_index_path(collection_name)
+        index = rebuild_case_label_index(client, collection_name, version, path)
+        done["case_label_index"] = f"{len(index)} cases -> {path}"
+    return done
+
+
+def main():
+    from dotenv import load_dotenv
+    from qdrant_client import QdrantClient
+    from RAG.utils.resources import resources
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Refresh derived caches after (re-)ingesting Qdrant / Neo4j.")
+    parser.add_argument("--collection", default="nomic_text_vectors")
+    parser.add_argument("--skip-qdrant", action="store_true", help="don't rebuild the case label index")
+    args = parser.parse_args()
+
+    client = None
+    if not args.skip_qdrant:
+        client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    # always the live graph: a KG_SNAPSHOT_PATH snapshot is read-only
+    for step, result in finalize_ingestion(resources.neo4j_graph, client, args.collection).items():
+        print(f"{step}: {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,423 @@
-import os
+import asyncio
+import logging
 import re
-from typing import Any, Dict, Optional, Tuple, List
+import time
+from typing import Any, Dict, Optional, Tuple, List, TypedDict
 from dotenv import load_dotenv
-from langchain_community.graphs import Neo4jGraph
-from qdrant_client import QdrantClient
-from qdrant_client.models import Filter, FieldCondition, MatchValue
-from sentence_transformers import CrossEncoder
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue, MatchAny, Prefetch, FusionQuery, Fusion, QueryRequest
+from RAG.utils.logSampling import log_verbose, should_dump
+from RAG.utils.metrics import metrics
+from RAG.utils.reranker import get_reranker
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
 
-# Load model Rerank
-reranker = CrossEncoder(os.getenv('ENCODE_MODEL'))
-
-graph = Neo4jGraph(
-    url=os.getenv('NEO4J_URI'),
-    username=os.getenv('NEO4J_USERNAME'),
-    password=os.getenv('NEO4J_PASSWORD')
-)
-print("Connected successfully!")
 
 def _build_filter(kvs: Optional[Dict[str, Any]]) -> Optional[Filter]:
     if not kvs:
         return None
     return Filter(must=[FieldCondition(key=k, match=MatchValue(value=v)) for k, v in kvs.items()])
 
+CASE_LABEL_SECTIONS: Tuple[str, ...] = (
+    "Disease Name Short",
+    "Final Diagnosis",
+    "Vitals",
+)
+
+
+def _case_sections_filter(case_ids: List[str], want_sections: Tuple[str, ...]) -> Filter:
+    return Filter(must=[
+        FieldCondition(key="case", match=MatchAny(any=case_ids)),
+        FieldCondition(key="section", match=MatchAny(any=list(want_sections))),
+    ])
+
+
+def _collect_case_sections(points, out: Dict[str, Dict[str, Optional[str]]]):
+    for p in points or []:
+        payload = p.payload or {}
+        labels = out.get(payload.get("case"))
+        sec = payload.get("section")
+        if labels is not None and sec in labels and labels[sec] is None:
+            # these section points carry their value in payload["text"]
+            labels[sec] = payload.get("text")
+
+
+def _gather_cases_sections(
+    client: QdrantClient,
+    collection: str,
+    case_ids,
+    want_sections: Tuple[str, ...] = CASE_LABEL_SECTIONS,
+    page_size: int = 256,
+) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Fetch the desired sections for many cases in a single filtered scroll
+    (MatchAny over case ids and sections, only case/section/text in the payload)
+    and regroup them per case client-side.
+    """
+    case_ids = list(dict.fromkeys(c for c in case_ids if c is not None))
+    out = {cid: {sec: None for sec in want_sections} for cid in case_ids}
+    if not case_ids:
+        return out
+
+    f = _case_sections_filter(case_ids, want_sections)
+
+    # Only label sections match, so this is normally a single page;
+    # keep paging in case a collection holds duplicate section points.
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=f,
+            with_payload=["case", "section", "text"],
+            with_vectors=False,
+            limit=page_size,
+            offset=offset,
+        )
+        _collect_case_sections(points, out)
+        if offset is None:
+            break
+
+    return out
+
+
+async def _gather_cases_sections_async(
+    client: AsyncQdrantClient,
+    collection: str,
+    case_ids,
+    want_sections: Tuple[str, ...] = CASE_LABEL_SECTIONS,
+    page_size: int = 256,
+) -> Dict[str, Dict[str, Optional[str]]]:
+    """Async twin of _gather_cases_sections."""
+    case_ids = list(dict.fromkeys(c for c in case_ids if c is not None))
+    out = {cid: {sec: None for sec in want_sections} for cid in case_ids}
+    if not case_ids:
+        return out
+
+    f = _case_sections_filter(case_ids, want_sections)
+    offset = None
+    while True:
+        points, offset = await client.scroll(
+            collection_name=collection,
+            scroll_filter=f,
+            with_payload=["case", "section", "text"],
+            with_vectors=False,
+            limit=page_size,
+            offset=offset,
+        )
+        _collect_case_sections(points, out)
+        if offset is None:
+            break
+
+    return out
+
+
 def _gather_case_sections(
     client: QdrantClient,
     collection: str,
     case_id: str,
-    want_sections: Tuple[str, ...] = (
-        "Disease Name Short",
-        "Final Diagnosis",
-        "Vitals",
-    ),
+    want_sections: Tuple[str, ...] = CASE_LABEL_SECTIONS,
 ) -> Dict[str, Optional[str]]:
-    """Scroll all points for a case and extract the text from desired sections."""
-    out = {sec: None for sec in want_sections}
-    f = Filter(must=[FieldCondition(key="case", match=MatchValue(value=case_id))])
-
-    # fetch a small page; most cases won't have many chunks
-    points, _ = client.scroll(
-        collection_name=collection,
-        scroll_filter=f,
+    """Extract the text from desired sections of a single case."""
+    return _gather_cases_sections(client, collection, [case_id], want_sections)[case_id]
+
+
+def _enrich_with_case_labels(results, case_labels: Dict[str, Dict[str, Optional[str]]]):
+    """Inject/overwrite the case label fields on every hit's payload."""
+    for r in results or []:
+        payload = r.payload or {}
+        case_id = payload.get("case")
+        if case_id and case_id in case_labels:
+            labels = case_labels[case_id]
+            for key in CASE_LABEL_SECTIONS:
+                if labels.get(key) is not None:
+                    payload[key] = labels[key]
+            r.payload = payload
+
+def _split_by_label_index(results, case_label_index):
+    """Return (labels found in the index, case ids that still need a scroll), per unique case."""
+    cases = list(dict.fromkeys(c for c in ((r.payload or {}).get("case") for r in results or []) if c is not None))
+    if case_label_index is None:
+        return {}, cases
+    case_labels = {c: case_label_index[c] for c in cases if c in case_label_index}
+    missing = [c for c in cases if c not in case_labels]
+    return case_labels, missing
+
+
+def _count_label_lookups(case_labels, missing):
+    # both per unique case, so hits / (hits + misses) is a per-case hit rate
+    metrics.inc("cache_hits_total", len(case_labels), cache="case_label_index")
+    metrics.inc("cache_misses_total", len(missing), cache="case_label_index")
+
+
+def _enrich_results(
+    client: QdrantClient,
+    collection_name: str,
+    results,
+    case_label_index: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+):
+    """Enrich hits from the in-memory label index, scrolling Qdrant only for unindexed cases."""
+    case_labels, missing = _split_by_label_index(results, case_label_index)
+    _count_label_lookups(case_labels, missing)
+    if missing:
+        # one filtered scroll for all (remaining) cases in the result set
+        with metrics.span("case_sections"):
+            case_labels.update(_gather_cases_sections(client, collection_name, missing))
+    _enrich_with_case_labels(results, case_labels)
+
+
+async def _enrich_results_async(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    results,
+    case_label_index: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+):
+    case_labels, missing = _split_by_label_index(results, case_label_index)
+    _count_label_lookups(case_labels, missing)
+    if missing:
+        with metrics.span("case_sections"):
+            case_labels.update(await _gather_cases_sections_async(client, collection_name, missing))
+    _enrich_with_case_labels(results, case_labels)
+
+
+def _rerank(query_text: str, results, top_k: int):
+    """Score every candidate with the cross-encoder and keep the best top_k."""
+    passages = [(r.payload or {}).get("text", "") for r in results]
+    scores = get_reranker().score(query_text, passages, [r.id for r in results])
+
+    for i, r in enumerate(results):
+        r.score = float(scores[i])
+
+    results.sort(key=lambda x: x.score, reverse=True)
+    return results[:top_k]
+
+
+def _adaptive_rerank(
+    query_text: str,
+    results,
+    top_k: int,
+    start_factor: int = 2,
+    dense_margin: float = 0.5,
+):
+    """
+    Rerank a growing prefix of the dense ranking instead of every candidate.
+
+    Starts with top_k * start_factor candidates and doubles the depth while
+      - the dense scores are ambiguous: the best unreranked candidate is within
+        `dense_margin` (as a fraction of the pool's score spread) of the dense top, and
+      - the reranked top-k ids still changed on the last widening.
+
+    Returns (top_k results, depth reranked, reason the loop stopped).
+    """
+    dense = [float(r.score) for r in results]  # query_points returns them sorted desc
+    spread = max(dense[0] - dense[-1], 1e-9)
+    reranker = get_reranker()
+
+    def score_range(lo, hi):
+        chunk = results[lo:hi]
+        scores = reranker.score(query_text, [(r.payload or {}).get("text", "") for r in chunk], [r.id for r in chunk])
+        for r, sc in zip(chunk, scores):
+            r.score = float(sc)
+
+    def top_ids(depth):
+        return [r.id for r in sorted(results[:depth], key=lambda x: x.score, reverse=True)[:top_k]]
+
+    depth = min(len(results), max(top_k * start_factor, top_k))
+    score_range(0, depth)
+    prev = top_ids(depth)
+    reason = "exhausted"
+
+    while depth < len(results):
+        if (dense[0] - dense[depth]) / spread >= dense_margin:
+            reason = "dense_gap"
+            break
+        new_depth = min(len(results), depth * 2)
+        score_range(depth, new_depth)
+        depth = new_depth
+        current = top_ids(depth)
+        if current == prev:
+            reason = "stable"
+            break
+        prev = current
+
+    reranked = sorted(results[:depth], key=lambda x: x.score, reverse=True)
+    return reranked[:top_k], depth, reason
+
+# (collection, sparse vector name) -> (declares that vector, monotonic time checked).
+# A missing vector is re-checked every SPARSE_RECHECK_S so a running process
+# picks up a backfill; once present it stays cached.
+_sparse_support: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+SPARSE_RECHECK_S = 60.0
+
+
+def _cached_sparse_support(collection_name: str, sparse_vector: str) -> Optional[bool]:
+    entry = _sparse_support.get((collection_name, sparse_vector))
+    if entry is None:
+        return None
+    supported, checked_at = entry
+    if not supported and time.monotonic() - checked_at >= SPARSE_RECHECK_S:
+        return None
+    return supported
+
+
+def _note_sparse_support(collection_name: str, sparse_vector: str, info) -> bool:
+    supported = sparse_vector in (info.config.params.sparse_vectors or {})
+    previous = _sparse_support.get((collection_name, sparse_vector))
+    if not supported and previous is None:
+        logger.warning(
+            "Collection %r has no sparse vector %r (run `python -m RAG.utils.sparseEmbeddings`); "
+            "falling back to dense-only search", collection_name, sparse_vector,
+        )
+    elif supported and previous is not None and not previous[0]:
+        logger.info("Collection %r now has sparse vector %r; using hybrid search", collection_name, sparse_vector)
+    _sparse_support[(collection_name, sparse_vector)] = (supported, time.monotonic())
+    return supported
+
+
+def _resolve_sparse_vector(client: QdrantClient, collection_name: str, sparse_vector: Optional[str]) -> Optional[str]:
+    """sparse_vector if the collection declares it, else None (dense-only)."""
+    if not sparse_vector:
+        return None
+    supported = _cached_sparse_support(collection_name, sparse_vector)
+    if supported is None:
+        supported = _note_sparse_support(collection_name, sparse_vector, client.get_collection(collection_name))
+    return sparse_vector if supported else None
+
+
+async def _resolve_sparse_vector_async(
+    client: AsyncQdrantClient, collection_name: str, sparse_vector: Optional[str],
+) -> Optional[str]:
+    if not sparse_vector:
+        return None
+    supported = _cached_sparse_support(collection_name, sparse_vector)
+    if supported is None:
+        supported = _note_sparse_support(collection_name, sparse_vector, await client.get_collection(collection_name))
+    return sparse_vector if supported else None
+
+
+def _candidate_limit(top_k: int, use_rerank: bool, sparse_vector: Optional[str], candidate_factor: Optional[int]) -> int:
+    if candidate_factor is None:
+        candidate_factor = 5 if sparse_vector else 10
+    return top_k * candidate_factor if use_rerank else top_k
+
+
+def _query_points_kwargs(
+    collection_name: str,
+    query_vector,
+    limit: int,
+    qdrant_filter: Optional[Filter],
+    using_vector: str,
+    sparse_vector: Optional[str] = None,
+    sparse_query=None,
+) -> Dict[str, Any]:
+    """Arguments for query_points: plain dense search, or dense + sparse prefetches fused with RRF."""
+    if sparse_vector:
+        return dict(
+            collection_name=collection_name,
+            prefetch=[
+                Prefetch(query=query_vector, using=using_vector, limit=limit, filter=qdrant_filter),
+                Prefetch(query=sparse_query, using=sparse_vector, limit=limit, filter=qdrant_filter),
+            ],
+            query=FusionQuery(fusion=Fusion.RRF),
+            limit=limit,
+            with_payload=True,
+            with_vectors=False,
+        )
+    return dict(
+        collection_name=collection_name,
+        query=query_vector,
+        limit=limit,
+        query_filter=qdrant_filter,
+        using=using_vector,
         with_payload=True,
         with_vectors=False,
-        limit=128,
     )
 
-    for p in points or []:
-        payload = p.payload or {}
-        sec = payload.get("section")
-        if sec in out and out[sec] is None:
-            # these section points carry their value in payload["text"]
-            out[sec] = payload.get("text")
 
-        # short-circuit if we already found everything
-        if all(v is not None for v in out.values()):
-            break
+def _query_request(
+    query_vector,
+    limit: int,
+    qdrant_filter: Optional[Filter],
+    using_vector: str,
+    sparse_vector: Optional[str] = None,
+    sparse_query=None,
+) -> QueryRequest:
+    """One entry of a query_batch_points call (same semantics as _query_points_kwargs)."""
+    if sparse_vector:
+        return QueryRequest(
+            prefetch=[
+                Prefetch(query=query_vector, using=using_vector, limit=limit, filter=qdrant_filter),
+                Prefetch(query=sparse_query, using=sparse_vector, limit=limit, filter=qdrant_filter),
+            ],
+            query=FusionQuery(fusion=Fusion.RRF),
+            limit=limit,
+            with_payload=True,
+            with_vector=False,
+        )
+    return QueryRequest(
+        query=query_vector,
+        using=using_vector,
+        filter=qdrant_filter,
+        limit=limit,
+        with_payload=True,
+        with_vector=False,
+    )
+
+
+def _candidate_cases(results) -> List[str]:
+    cases = ((r.payload or {}).get("case") for r in results or [])
+    return list(dict.fromkeys(c for c in cases if c is not None))
+
+
+def _rerank_results(query_text: str, results, top_k: int, use_rerank: bool, adaptive_rerank: bool):
+    """Returns (results, depth, reason); shared by the sync and async search paths."""
+    depth, reason = 0, "disabled"
+    if use_rerank and results:
+        with metrics.span("rerank"):
+            if adaptive_rerank:
+                results, depth, reason = _adaptive_rerank(query_text, results, top_k)
+            else:
+                results, depth, reason = _rerank(query_text, results, top_k), len(results), "full"
+        metrics.inc("candidates_reranked_total", depth)
+    return results, depth, reason
 
-    return out
 
 # ---- main function -----------------------------------------------------------
 
+def _clip(value: Optional[str], n: int = 120) -> str:
+    value = value or ""
+    return value[:n] + ("…" if len(value) > n else "")
+
+
+def _format_hits(results) -> str:
+    """Multi-line dump of hits and their enriched labels (debug output only)."""
+    lines = []
+    for i, r in enumerate(results or [], 1):
+        py = r.payload or {}
+        lines.append(
+            f"{i}. ID: {getattr(r, 'id', None)}, Score: {getattr(r, 'score', 0.0):.4f}\n"
+            f"   case={py.get('case')}  section={py.get('section')}\n"
+            f"   Disease Name Short={py.get('Disease Name Short')}\n"
+            f"   Final Diagnosis={_clip(py.get('Final Diagnosis'))}\n"
+            f"   Vitals={_clip(py.get('Vitals'))}\n"
+            f"   Text: {py.get('text')}"
+        )
+    return "\n".join(lines)
+
+
+def _log_hits(title: str, results, verbose: bool = False):
+    """
+    Dump hits at DEBUG (sampled, see logSampling.py), or at INFO when the
+    caller asked for verbose output (shown even if logging is not configured
+    for INFO, see log_verbose). No formatting happens otherwise.
+    """
+    if verbose:
+        log_verbose(logger, "%s (%d):\n%s", title, len(results or []), _format_hits(results))
+    elif should_dump(logger):
+        logger.debug("%s (%d):\n%s", title, len(results or []), _format_hits(results))
+
+
 def search_vectors(
     query_text_or_image,
     client: QdrantClient,
@@ -71,10 +426,11 @@ def search_vectors(
     top_k: int = 5,
     filters: Optional[Dict[str, Any]] = None,
     using_vector: str = "nomic-embed-text",
-    verbose: bool = True,
+    verbose: bool = False,
 ):
     """
     Vector search + label enrichment.
+    Hits are logged via _log_hits (verbose=True forces the dump at INFO).
 
     Returns: list[ScoredPoint] where each .payload is augmented with:
         - 'Disease Name Short': str | None
@@ -103,50 +459,19 @@ def search_vectors(
         )
         results = list(qp.points)
     except Exception as e:
-        if verbose:
-            print(f"Query error: {e}")
+        logger.warning("Query error: %s", e)
         raise
 
-    # 4) enrich with diagnosis fields from same case (one scroll per case)
-    cases = { (r.payload or {}).get("case") for r in results or [] }
-    cases.discard(None)
-
-    case_labels: Dict[str, Dict[str, Optional[str]]] = {}
-    for case_id in cases:
-        case_labels[case_id] = _gather_case_sections(client, collection_name, case_id)
-
-    for r in results or []:
-        payload = r.payload or {}
-        case_id = payload.get("case")
-        if case_id and case_id in case_labels:
-            labels = case_labels[case_id]
-            # inject/overwrite keys; keep it explicit
-            if labels.get("Disease Name Short") is not None:
-                payload["Disease Name Short"] = labels["Disease Name Short"]
-            if labels.get("Final Diagnosis") is not None:
-                payload["Final Diagnosis"] = labels["Final Diagnosis"]
-            if labels.get("Vitals") is not None:
-                payload["Vitals"] = labels["Vitals"]
-            r.payload = payload
-
-    if verbose:
-        print("\n🔎 Enriched results:\n")
-        for i, r in enumerate(results or [], 1):
-            py = r.payload or {}
-            print(
-                f"     Payload:{py}"
-                f"{i}. ID: {getattr(r, 'id', None)}, Score: {getattr(r, 'score', None):.4f}\n"
-                f"   case={py.get('case')}  section={py.get('section')}\n"
-                f"   Disease Name Short={py.get('Disease Name Short')}\n"
-                f"   Final Diagnosis={(py.get('Final Diagnosis') or '')[:120]}{'…' if py.get('Final Diagnosis') and len(py['Final Diagnosis'])>120 else ''}\n"
-                f"   Vitals={(py.get('Vitals') or '')[:120]}{'…' if py.get('Vitals') and len(py['Vitals'])>120 else ''}\n"
-                f"   Text: {py.get('text')}\n"
-            )
-
+    # 4) enrich with diagnosis fields from same case (one scroll for all cases)
+    cases = [(r.payload or {}).get("case") for r in results or []]
+    case_labels = _gather_cases_sections(client, collection_name, cases)
+    _enrich_with_case_labels(results, case_labels)
+    _log_hits("Enriched results", results, verbose)
     return results
 
 
 
+@metrics.timed("search")
 def search_vectors_v2(
     query_text: str,
     client: QdrantClient,
@@ -155,201 +480,318 @@ def search_vectors_v2(
     top_k: int = 3,
     filters: Optional[Dict[str, Any]] = None,
     using_vector: str = "nomic-embed-text",
-    verbose: bool = True,
+    verbose: bool = False,
     use_rerank: bool = True,
+    case_label_index: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+    adaptive_rerank: bool = False,
+    stats: Optional[Dict[str, Any]] = None,
+    sparse_vector: Optional[str] = None,
+    sparse_embedding_fn=None,
+    candidate_factor: Optional[int] = None,
+    on_candidates=None,
 ):
+    """
+    Vector search + cross-encoder rerank + label enrichment.
+
+    If case_label_index (see RAG/utils/caseLabelIndex.py) is given, labels are
+    looked up in memory and Qdrant is only scrolled for cases missing from it.
+    With adaptive_rerank, only as many candidates as the dense score
+    distribution calls for are reranked (see _adaptive_rerank).
+    If a stats dict is passed it is filled with the candidate count and the
+    rerank depth/stop reason actually used.
+
+    Hybrid mode: when sparse_vector names a sparse vector of the collection
+    (see RAG/utils/sparseEmbeddings.py), the dense and sparse queries are sent
+    as two prefetches fused with RRF in a single query_points request. Keyword
+    hits make the fused list more precise, so the rerank pool defaults to
+    top_k * 5 instead of top_k * 10 (override with candidate_factor). If the
+    collection does not declare that sparse vector, the search is dense-only.
+
+    on_candidates, if given, is called with the distinct candidate case ids
+    (dense order) before reranking, so callers can start per-case work such as
+    the knowledge-graph fetch while the cross-encoder runs.
+
+    Final hits are logged via _log_hits (verbose=True forces the dump at INFO).
+    """
     if embedding_fn is None:
         raise ValueError("embedding_fn is required")
 
     # 1. Embed query
     query_vector = embedding_fn(query_text)
     qdrant_filter = _build_filter(filters)
+    sparse_vector = _resolve_sparse_vector(client, collection_name, sparse_vector)
 
-    initial_k = top_k * 10 if use_rerank else top_k
+    initial_k = _candidate_limit(top_k, use_rerank, sparse_vector, candidate_factor)
+
+    sparse_query = None
+    if sparse_vector:
+        if sparse_embedding_fn is None:
+            from RAG.utils.sparseEmbeddings import embed_sparse_query
+            sparse_embedding_fn = embed_sparse_query
+        sparse_query = sparse_embedding_fn(query_text)
 
     try:
-        qp = client.query_points(
-            collection_name=collection_name,
-            query=query_vector,
-            limit=initial_k, # <--- Lấy 50 kết quả
-            query_filter=qdrant_filter,
-            using=using_vector,
-            with_payload=True,
-            with_vectors=False,
-        )
+        with metrics.span("query_points"):
+            qp = client.query_points(**_query_points_kwargs(
+                collection_name, query_vector, initial_k, qdrant_filter,
+                using_vector, sparse_vector, sparse_query,
+            ))
         results = list(qp.points)
     except Exception as e:
-        if verbose: print(f"Query error: {e}")
+        logger.warning("Query error: %s", e)
         raise
 
-    if use_rerank and results:
-        if verbose: print(f"🔄 Reranking {len(results)} candidates...")
+    n_candidates = len(results)
+    if on_candidates is not None:
+        on_candidates(_candidate_cases(results))
+    results, depth, reason = _rerank_results(query_text, results, top_k, use_rerank, adaptive_rerank)
+    if depth:
+        logger.debug("Reranked %d/%d candidates (%s)", depth, n_candidates, reason)
 
+    if stats is not None:
+        stats.update({"candidates": n_candidates, "rerank_depth": depth, "rerank_stop": reason})
 
-        pairs = [[query_text, (r.payload or {}).get("text", "")] for r in results]
+    _enrich_results(client, collection_name, results, case_label_index)
+    _log_hits("Final results", results, verbose)
+    return results
 
-        scores = reranker.predict(pairs)
 
+@metrics.timed("search_batch")
+def search_vectors_v2_batch(
+    query_texts: List[str],
+    client: QdrantClient,
+    collection_name: str = "nomic_text_vectors",
+    batch_embedding_fn=None,
+    top_k: int = 3,
+    filters: Optional[Dict[str, Any]] = None,
+    using_vector: str = "nomic-embed-text",
+    use_rerank: bool = True,
+    case_label_index: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+    sparse_vector: Optional[str] = None,
+    sparse_batch_embedding_fn=None,
+    candidate_factor: Optional[int] = None,
+) -> List[list]:
+    """
+    search_vectors_v2 for many questions at once, returning one result list per
+    question in input order:
+      - one batched embedding call for all questions,
+      - one query_batch_points request,
+      - one cross-encoder predict() over every (question, candidate) pair,
+      - one enrichment pass over all cases.
+    Reranking is always full depth here (no adaptive mode).
+    """
+    if batch_embedding_fn is None:
+        raise ValueError("batch_embedding_fn is required")
+    if not query_texts:
+        return []
 
-        for i, r in enumerate(results):
-            r.score = float(scores[i])
+    query_vectors = [list(map(float, row)) for row in batch_embedding_fn(query_texts)]
+    qdrant_filter = _build_filter(filters)
+    sparse_vector = _resolve_sparse_vector(client, collection_name, sparse_vector)
+    initial_k = _candidate_limit(top_k, use_rerank, sparse_vector, candidate_factor)
+
+    sparse_queries = [None] * len(query_texts)
+    if sparse_vector:
+        if sparse_batch_embedding_fn is None:
+            from RAG.utils.sparseEmbeddings import embed_sparse_queries
+            sparse_batch_embedding_fn = embed_sparse_queries
+        sparse_queries = sparse_batch_embedding_fn(query_texts)
+
+    with metrics.span("query_batch_points"):
+        responses = client.query_batch_points(
+            collection_name=collection_name,
+            requests=[
+                _query_request(vec, initial_k, qdrant_filter, using_vector, sparse_vector, sparse)
+                for vec, sparse in zip(query_vectors, sparse_queries)
+            ],
+        )
+    all_results = [list(resp.points) for resp in responses]
+
+    if use_rerank:
+        with metrics.span("rerank_batch"):
+            scores = get_reranker().score_many(
+                query_texts,
+                [[(r.payload or {}).get("text", "") for r in results] for results in all_results],
+                [[r.id for r in results] for results in all_results],
+            )
+        metrics.inc("candidates_reranked_total", sum(len(results) for results in all_results))
+        for i, (results, query_scores) in enumerate(zip(all_results, scores)):
+            for r, sc in zip(results, query_scores):
+                r.score = float(sc)
+            all_results[i] = sorted(results, key=lambda x: x.score, reverse=True)[:top_k]
 
-        results.sort(key=lambda x: x.score, reverse=True)
+    _enrich_results(client, collection_name, [r for results in all_results for r in results], case_label_index)
+    return all_results
 
-        results = results[:top_k]
 
+@metrics.timed("search")
+async def search_vectors_v2_async(
+    query_text: str,
+    client: AsyncQdrantClient,
+    collection_name: str = "nomic_text_vectors",
+    embedding_fn=None,
+    top_k: int = 3,
+    filters: Optional[Dict[str, Any]] = None,
+    using_vector: str = "nomic-embed-text",
+    use_rerank: bool = True,
+    case_label_index: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+    adaptive_rerank: bool = False,
+    stats: Optional[Dict[str, Any]] = None,
+    sparse_vector: Optional[str] = None,
+    sparse_embedding_fn=None,
+    candidate_factor: Optional[int] = None,
+    executor=None,
+    on_candidates=None,
+):
+    """
+    Async version of search_vectors_v2 on an AsyncQdrantClient.
 
-    cases = { (r.payload or {}).get("case") for r in results or [] }
-    cases.discard(None)
+    Network calls (query_points, scroll) are awaited on the event loop; the
+    CPU-bound steps (dense/sparse embedding, reranking) run in `executor`
+    so they never block it.
+    """
+    if embedding_fn is None:
+        raise ValueError("embedding_fn is required")
 
-    case_labels: Dict[str, Dict[str, Optional[str]]] = {}
-    for case_id in cases:
-        case_labels[case_id] = _gather_case_sections(client, collection_name, case_id)
+    loop = asyncio.get_running_loop()
 
-    for r in results or []:
-        payload = r.payload or {}
-        case_id = payload.get("case")
-        if case_id and case_id in case_labels:
-            labels = case_labels[case_id]
-            for key in ["Disease Name Short", "Final Diagnosis", "Vitals"]:
-                if labels.get(key) is not None:
-                    payload[key] = labels[key]
-            r.payload = payload
+    query_vector = await loop.run_in_executor(executor, embedding_fn, query_text)
+    qdrant_filter = _build_filter(filters)
+    sparse_vector = await _resolve_sparse_vector_async(client, collection_name, sparse_vector)
+    initial_k = _candidate_limit(top_k, use_rerank, sparse_vector, candidate_factor)
+
+    sparse_query = None
+    if sparse_vector:
+        if sparse_embedding_fn is None:
+            from RAG.utils.sparseEmbeddings import embed_sparse_query
+            sparse_embedding_fn = embed_sparse_query
+        sparse_query = await loop.run_in_executor(executor, sparse_embedding_fn, query_text)
+
+    with metrics.span("query_points"):
+        qp = await client.query_points(**_query_points_kwargs(
+            collection_name, query_vector, initial_k, qdrant_filter,
+            using_vector, sparse_vector, sparse_query,
+        ))
+    results = list(qp.points)
+
+    n_candidates = len(results)
+    if on_candidates is not None:
+        on_candidates(_candidate_cases(results))
+    results, depth, reason = await loop.run_in_executor(
+        executor, _rerank_results, query_text, results, top_k, use_rerank, adaptive_rerank,
+    )
+    if depth:
+        logger.debug("Reranked %d/%d candidates (%s)", depth, n_candidates, reason)
 
-    if verbose:
-        print(f"\n🔎 Final Results (Top {len(results)}):")
-        for i, r in enumerate(results, 1):
-            py = r.payload
-            print(f"{i}. Score: {r.score:.4f} | Case: {py.get('case')} | Section: {py.get('section')}")
-            print(f"   Text: {(py.get('text') or '')}...")
-            if py.get('Final Diagnosis'):
-                print(f"   [Enriched] Diagnosis: {py.get('Final Diagnosis')}...")
-            print("-" * 40)
+    if stats is not None:
+        stats.update({"candidates": n_candidates, "rerank_depth": depth, "rerank_stop": reason})
 
+    await _enrich_results_async(client, collection_name, results, case_label_index)
+    _log_hits("Final results", results)
     return results
 
 
-def get_cases_knowledge_graph(knowledgeGraph, case_list):
-    # 1. Pre-process: Extract IDs and maintain order
-    # targets: [91, 102, 91] (Integer IDs in requested order)
+# ---- knowledge graph ------------------------------------------------------------
+
+# relationship type -> (output key, display label), in output order
+KG_RELATIONS: Dict[str, Tuple[str, str]] = {
+    "HAS_SYMPTOM": ("symptoms", "Symptoms"),
+    "LOCATED_IN": ("locations", "Locations"),
+    "OF_DISEASE": ("diagnosis", "Diagnosis"),
+    "HAS_INFO": ("details", "Details"),
+    "HAS_EPIDEMIOLOGY": ("epidemiology", "Epidemiology"),
+    "HAS_INVESTIGATION": ("investigations", "Investigations"),
+    "HAS_RISK_FACTOR": ("risk_factors_patient_profile", "Risk Factors & Patient Profile"),
+}
+KG_GENERAL = ("general", "General")
+
+
+class CaseKnowledge(TypedDict, total=False):
+    has_info: bool
+    case_id: int
+    symptoms: Optional[str]
+    locations: Optional[str]
+    diagnosis: Optional[str]
+    details: Optional[str]
+    epidemiology: Optional[str]
+    investigations: Optional[str]
+    risk_factors_patient_profile: Optional[str]
+    general: Optional[str]
+
+
+# Neighbors are grouped per relationship type server-side, so each case comes back
+# as a handful of (rel, [values]) pairs instead of one map per neighbor.
+CASE_KNOWLEDGE_QUERY = """
+MATCH (c:Case)
+// Match against either property name
+WHERE c.case_id IN $ids OR c.file_id IN $ids
+
+// Include all relationship types from both datasets
+OPTIONAL MATCH (c)-[r:HAS_INFO|HAS_SYMPTOM|LOCATED_IN|OF_DISEASE|HAS_RISK_FACTOR|HAS_INVESTIGATION|HAS_EPIDEMIOLOGY]->(neighbor)
+
+WITH c, type(r) AS rel, collect(
+    CASE
+        WHEN type(r) IN ['HAS_SYMPTOM', 'LOCATED_IN', 'OF_DISEASE'] THEN neighbor.name
+        ELSE coalesce(neighbor.content, neighbor.name)
+    END
+) AS vals
+RETURN
+    coalesce(c.case_id, c.file_id) AS id,
+    collect({rel: rel, vals: vals}) AS groups
+"""
+
+
+def _parse_case_ids(case_list) -> List[int]:
+    """'Case91' -> 91, keeping the requested order (duplicates included)."""
     ids = []
-
     for case_str in case_list:
         match = re.search(r'\d+', case_str)
         if match:
-            cid = int(match.group())
-            ids.append(cid)
-
+            ids.append(int(match.group()))
+    return ids
+
+
+def _case_knowledge_from_groups(cid: int, groups) -> CaseKnowledge:
+    """Build the per-case structure in one pass over the server-side groups."""
+    info: CaseKnowledge = {"has_info": True, "case_id": cid}
+    for key, _ in KG_RELATIONS.values():
+        info[key] = None
+    info[KG_GENERAL[0]] = None
+
+    for group in groups or []:
+        rel, vals = group.get("rel"), group.get("vals")
+        if rel is None or not vals:
+            continue  # case without neighbors
+        key, label = KG_RELATIONS.get(rel, KG_GENERAL)
+        joined = ", ".join(vals)
+        info[key] = f"{label}: {joined}" if info[key] is None else f"{info[key]}, {joined}"
+    return info
+
+
+@metrics.timed("kg_query")
+def fetch_case_knowledge(knowledgeGraph, ids: List[int]) -> Dict[int, CaseKnowledge]:
+    """One Cypher call for all ids; returns {case id: CaseKnowledge} for the cases found."""
     if not ids:
-        return []
+        return {}
+    records = knowledgeGraph.query(CASE_KNOWLEDGE_QUERY, {"ids": list(dict.fromkeys(ids))})
+    return {rec["id"]: _case_knowledge_from_groups(rec["id"], rec["groups"]) for rec in records}
 
-    query = """
-    MATCH (c:Case)
-    WHERE c.case_id IN $case_ids
-    OPTIONAL MATCH (c)-[r:HAS_INFO|HAS_SYMPTOM|LOCATED_IN|OF_DISEASE]->(neighbor)
-    RETURN 
-        c.case_id AS id,
-        collect(
-            CASE type(r)
-                WHEN 'HAS_SYMPTOM' THEN { label: 'Symptom', val: neighbor.name }
-                WHEN 'LOCATED_IN'  THEN { label: 'Location', val: neighbor.name }
-                WHEN 'OF_DISEASE'  THEN { label: 'Diagnosis', val: neighbor.name }
-                WHEN 'HAS_INFO'    THEN { label: 'Details',   val: coalesce(neighbor.name, neighbor.content) }
-                ELSE { label: 'General', val: coalesce(neighbor.name, neighbor.content) }
-            END
-        ) AS attributes
-    """
 
-    query_v2 = """
-    MATCH (c:Case)
-    WHERE c.case_id IN $case_ids
-    OPTIONAL MATCH (c)-[r:HAS_INFO|HAS_SYMPTOM|LOCATED_IN|OF_DISEASE|HAS_RISK_FACTOR|HAS_INVESTIGATION|HAS_EPIDEMIOLOGY]->(neighbor)
-    RETURN 
-        c.case_id AS id,
-        collect(
-            CASE type(r)
-                WHEN 'HAS_SYMPTOM'      THEN { label: 'Symptoms', val: neighbor.name }
-                WHEN 'LOCATED_IN'       THEN { label: 'Locations', val: neighbor.name }
-                WHEN 'OF_DISEASE'       THEN { label: 'Diagnosis', val: neighbor.name }
-                WHEN 'HAS_INFO'         THEN { label: 'Details', val: coalesce(neighbor.content, neighbor.name) }
-                WHEN 'HAS_EPIDEMIOLOGY' THEN { label: 'Epidemiology', val: coalesce(neighbor.content, neighbor.name) }
-                WHEN 'HAS_INVESTIGATION' THEN { label: 'Investigations', val: coalesce(neighbor.content, neighbor.name) }
-                WHEN 'HAS_RISK_FACTOR'  THEN { label: 'Risk Factors & Patient Profile', val: coalesce(neighbor.content, neighbor.name) }
-                ELSE { label: 'General', val: coalesce(neighbor.content, neighbor.name) }
-            END
-        ) AS attributes
+@metrics.timed("knowledge_graph")
+def get_cases_knowledge_graph(knowledgeGraph, case_list) -> List[CaseKnowledge]:
     """
-
-    query_v3 = """
-    MATCH (c:Case)
-    // Match against either property name
-    WHERE c.case_id IN $ids OR c.file_id IN $ids
-
-    // Include all relationship types from both datasets
-    OPTIONAL MATCH (c)-[r:HAS_INFO|HAS_SYMPTOM|LOCATED_IN|OF_DISEASE|HAS_RISK_FACTOR|HAS_INVESTIGATION|HAS_EPIDEMIOLOGY]->(neighbor)
-
-    RETURN 
-        coalesce(c.case_id, c.file_id) AS id,
-        collect(
-            CASE type(r)
-                WHEN 'HAS_SYMPTOM'      THEN { label: 'Symptoms', val: neighbor.name }
-                WHEN 'LOCATED_IN'       THEN { label: 'Locations', val: neighbor.name }
-                WHEN 'OF_DISEASE'       THEN { label: 'Diagnosis', val: neighbor.name }
-                WHEN 'HAS_INFO'         THEN { label: 'Details', val: coalesce(neighbor.content, neighbor.name) }
-                WHEN 'HAS_EPIDEMIOLOGY' THEN { label: 'Epidemiology', val: coalesce(neighbor.content, neighbor.name) }
-                WHEN 'HAS_INVESTIGATION' THEN { label: 'Investigations', val: coalesce(neighbor.content, neighbor.name) }
-                WHEN 'HAS_RISK_FACTOR'  THEN { label: 'Risk Factors & Patient Profile', val: coalesce(neighbor.content, neighbor.name) }
-                ELSE { label: 'General', val: coalesce(neighbor.content, neighbor.name) }
-            END
-        ) AS attributes
+    Knowledge-graph attributes for each case in case_list, in the same order.
+    Cases missing from the graph come back as {"has_info": False}.
+    knowledgeGraph is a Neo4jGraph or a CaseKnowledgeCache wrapping one.
     """
+    ids = _parse_case_ids(case_list)
+    if not ids:
+        return []
 
-    # We do NOT use ORDER BY in SQL anymore because we will order by Python list logic
-    # results = graph.query(query_v2, {"case_ids": ids})
-    results = knowledgeGraph.query(query_v3, {"ids": ids})
-    # print(f"Results: {results}")
-
-    # 3. Create a lookup dictionary: { 91: {data...}, 102: {data...} }
-    results_lookup = {rec['id']: rec for rec in results}
-
-    output_parts = []
-
-    # 4. Iterate through the ORIGINAL target list to preserve input order and handle missing items
-    for cid in ids:
-        # Check if database returned data for this ID
-        record = results_lookup.get(cid)
-        if record:
-            symptoms = [item['val'] for item in record['attributes'] if item.get('label') == 'Symptoms']
-            locations = [item['val'] for item in record['attributes'] if item.get('label') == 'Locations']
-            details = [item['val'] for item in record['attributes'] if item.get('label') == 'Details']
-            diagnoses = [item['val'] for item in record['attributes'] if item.get('label') == 'Diagnosis']
-            epidemiology = [item['val'] for item in record['attributes'] if item.get('label') == 'Epidemiology']
-            investigations = [item['val'] for item in record['attributes'] if item.get('label') == 'Investigations']
-            risk_factors_patient_profile = [item['val'] for item in record['attributes'] if
-                                            item.get('label') == 'Risk Factors & Patient Profile']
-            general = [item['val'] for item in record['attributes'] if item.get('label') == 'General']
-
-            info = {
-                "has_info": True,
-                "case_id": cid,
-                "symptoms": f"Symptoms: {', '.join(symptoms)}" if symptoms else None,
-                "locations": f"Locations: {', '.join(locations)}" if locations else None,
-                "diagnosis": f"Diagnosis: {', '.join(diagnoses)}" if diagnoses else None,
-                "details": f"Details: {', '.join(details)}" if details else None,
-                "epidemiology": f"Epidemiology: {', '.join(epidemiology)}" if epidemiology else None,
-                "investigations": f"Investigations: {', '.join(investigations)}" if investigations else None,
-                "risk_factors_patient_profile": f"Risk Factors & Patient Profile: {', '.join(risk_factors_patient_profile)}" if risk_factors_patient_profile else None,
-                "general": f"General: {', '.join(general)}" if general else None,
-            }
-        else:
-            # Case not found in DB: Append empty structure
-            info = {
-                "has_info": False
-            }
-
-        output_parts.append(info)
-
-    return output_parts
+    # a CaseKnowledgeCache (RAG/utils/kgCache.py) brings its own fetch
+    fetch = getattr(knowledgeGraph, "fetch_case_knowledge", None)
+    found = fetch(ids) if fetch else fetch_case_knowledge(knowledgeGraph, ids)
+    return [found.get(cid) or {"has_info": False} for cid in ids]
 
 
 async def process_item(hits: List[dict]):
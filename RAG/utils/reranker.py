@@ -0,0 +1,249 @@
+import hashlib
+import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from RAG.utils.metrics import metrics
+
+
+def _count_lookups(hits: int, misses: int):
+    metrics.inc("cache_hits_total", hits, cache="rerank")
+    metrics.inc("cache_misses_total", misses, cache="rerank")
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class RerankerService:
+    """
+    Cross-encoder reranker with lazy loading, an LRU score cache and request
+    coalescing.
+
+    - The CrossEncoder is loaded on first use (or warmup()), not at import.
+    - Scores are cached by (query hash, chunk id); chunks without an id fall
+      back to a hash of their text.
+    - score() hands its uncached pairs to one worker thread, which drains every
+      request queued within `coalesce_ms` and scores them in a single
+      predict() call, so concurrent queries share forward passes.
+    """
+
+    def __init__(
+        self,
+        model_name: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        max_length: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        coalesce_ms: Optional[float] = None,
+        max_pairs_per_pass: int = 512,
+    ):
+        # unset arguments fall back to the environment (read here, after load_dotenv)
+        self._model_name = model_name
+        self._batch_size = batch_size or int(os.getenv("RERANK_BATCH_SIZE", "32"))
+        self._max_length = max_length or int(os.getenv("RERANK_MAX_LENGTH", "512"))
+        self._cache_size = cache_size or int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+        if coalesce_ms is None:
+            coalesce_ms = float(os.getenv("RERANK_COALESCE_MS", "2"))
+        self._coalesce_s = coalesce_ms / 1000.0
+        self._max_pairs_per_pass = max_pairs_per_pass
+
+        self._model = None
+        self._model_lock = threading.Lock()
+
+        self._cache: "OrderedDict[tuple, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.forward_passes = 0
+        self.coalesced_requests = 0
+
+    # ---- model ---------------------------------------------------------------
+
+    def _get_model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(
+                        self._model_name or os.getenv("ENCODE_MODEL"),
+                        max_length=self._max_length,
+                    )
+        return self._model
+
+    def warmup(self):
+        self._get_model()
+
+    def unload(self):
+        with self._model_lock:
+            self._model = None
+
+    # ---- cache ---------------------------------------------------------------
+
+    def _cache_get_many(self, keys):
+        out = []
+        with self._cache_lock:
+            for k in keys:
+                v = self._cache.get(k)
+                if v is not None:
+                    self._cache.move_to_end(k)
+                out.append(v)
+        return out
+
+    def _cache_put_many(self, items):
+        with self._cache_lock:
+            for k, v in items:
+                self._cache[k] = v
+                self._cache.move_to_end(k)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    # ---- coalescing worker ---------------------------------------------------
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._worker_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="reranker", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            jobs = [self._queue.get()]
+            n_pairs = len(jobs[0][0])
+            # collect whatever else arrives within the coalescing window
+            while n_pairs < self._max_pairs_per_pass:
+                try:
+                    job = self._queue.get(timeout=self._coalesce_s)
+                except queue.Empty:
+                    break
+                jobs.append(job)
+                n_pairs += len(job[0])
+
+            pairs = [pair for job_pairs, _ in jobs for pair in job_pairs]
+            try:
+                scores = self._get_model().predict(
+                    pairs,
+                    batch_size=self._batch_size,
+                    show_progress_bar=False,
+                )
+            except Exception as e:
+                for _, fut in jobs:
+                    fut.set_exception(e)
+                continue
+
+            self.forward_passes += 1
+            self.coalesced_requests += len(jobs) - 1
+            start = 0
+            for job_pairs, fut in jobs:
+                fut.set_result(np.asarray(scores[start:start + len(job_pairs)], dtype=np.float32))
+                start += len(job_pairs)
+
+    def _predict(self, pairs: List[List[str]]) -> np.ndarray:
+        fut: Future = Future()
+        self._ensure_worker()
+        self._queue.put((pairs, fut))
+        return fut.result()
+
+    # ---- public API ----------------------------------------------------------
+
+    def score(self, query: str, passages: Sequence[str], passage_ids: Optional[Sequence] = None) -> np.ndarray:
+        """Cross-encoder scores for (query, passage) pairs, in passage order."""
+        if not passages:
+            return np.empty(0, dtype=np.float32)
+
+        q = _hash(query)
+        if passage_ids is None:
+            passage_ids = [None] * len(passages)
+        keys = [(q, pid if pid is not None else _hash(text)) for pid, text in zip(passage_ids, passages)]
+
+        scores = np.empty(len(passages), dtype=np.float32)
+        todo = []
+        for i, cached in enumerate(self._cache_get_many(keys)):
+            if cached is None:
+                todo.append(i)
+            else:
+                scores[i] = cached
+
+        with self._cache_lock:
+            self.cache_hits += len(passages) - len(todo)
+            self.cache_misses += len(todo)
+        _count_lookups(len(passages) - len(todo), len(todo))
+        if todo:
+            fresh = self._predict([[query, passages[i]] for i in todo])
+            scores[todo] = fresh
+            self._cache_put_many(zip((keys[i] for i in todo), fresh.tolist()))
+
+        return scores
+
+    def score_many(
+        self,
+        queries: Sequence[str],
+        passages_per_query: Sequence[Sequence[str]],
+        ids_per_query: Optional[Sequence[Sequence]] = None,
+    ) -> List[np.ndarray]:
+        """
+        score() for several queries at once: the uncached pairs of all queries
+        go to the model together, so a batch of questions costs one predict().
+        """
+        if ids_per_query is None:
+            ids_per_query = [None] * len(queries)
+
+        all_keys, all_pairs, spans = [], [], []
+        for query, passages, ids in zip(queries, passages_per_query, ids_per_query):
+            q = _hash(query)
+            ids = ids if ids is not None else [None] * len(passages)
+            spans.append((len(all_keys), len(all_keys) + len(passages)))
+            all_keys.extend((q, pid if pid is not None else _hash(text)) for pid, text in zip(ids, passages))
+            all_pairs.extend([query, text] for text in passages)
+
+        flat = np.empty(len(all_keys), dtype=np.float32)
+        todo = []
+        for i, cached in enumerate(self._cache_get_many(all_keys)):
+            if cached is None:
+                todo.append(i)
+            else:
+                flat[i] = cached
+
+        with self._cache_lock:
+            self.cache_hits += len(all_keys) - len(todo)
+            self.cache_misses += len(todo)
+        _count_lookups(len(all_keys) - len(todo), len(todo))
+        if todo:
+            fresh = self._predict([all_pairs[i] for i in todo])
+            flat[todo] = fresh
+            self._cache_put_many(zip((all_keys[i] for i in todo), fresh.tolist()))
+
+        return [flat[lo:hi] for lo, hi in spans]
+
+    def stats(self) -> dict:
+        return {
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "forward_passes": self.forward_passes,
+            "coalesced_requests": self.coalesced_requests,
+            "cache_items": len(self._cache),
+        }
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> RerankerService:
+    """Process-wide reranker; the model itself is still only loaded on first score()."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = RerankerService()
+    return _reranker
@@ -0,0 +1,122 @@
+import os
+import threading
+
+
+class ResourceRegistry:
+    """
+    Owner of the process-wide external handles (graph, reranker, retriever).
+
+    Nothing is created at import time: each handle is built on first access and
+    then reused, so scripts that never touch the graph never connect to Neo4j.
+    warmup() lets long-lived workers pay the cost up front instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._neo4j_graph = None
+        self._snapshot = None
+        self._case_knowledge = None
+
+    @property
+    def graph(self):
+        """
+        The knowledge graph: a KnowledgeGraphSnapshot when KG_SNAPSHOT_PATH is
+        set (no Neo4j needed), otherwise the live Neo4j graph.
+        """
+        path = os.getenv("KG_SNAPSHOT_PATH")
+        if not path:
+            return self.neo4j_graph
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    from RAG.utils.kgSnapshot import KnowledgeGraphSnapshot
+                    self._snapshot = KnowledgeGraphSnapshot(path)
+        return self._snapshot
+
+    @property
+    def neo4j_graph(self):
+        """Neo4jGraph sharing one driver (and its connection pool) across callers."""
+        if self._neo4j_graph is None:
+            with self._lock:
+                if self._neo4j_graph is None:
+                    from langchain_community.graphs import Neo4jGraph
+                    self._neo4j_graph = Neo4jGraph(
+                        url=os.getenv('NEO4J_URI'),
+                        username=os.getenv('NEO4J_USERNAME'),
+                        password=os.getenv('NEO4J_PASSWORD'),
+                        # we only run our own Cypher, the APOC schema scan is wasted startup time
+                        refresh_schema=False,
+                        driver_config={
+                            "max_connection_pool_size": int(os.getenv("NEO4J_MAX_POOL_SIZE", "10")),
+                            "connection_acquisition_timeout": float(os.getenv("NEO4J_ACQUIRE_TIMEOUT_S", "10")),
+                        },
+                    )
+        return self._neo4j_graph
+
+    @property
+    def case_knowledge(self):
+        """
+        CaseKnowledgeCache over the live graph (snapshot file: KG_CACHE_SNAPSHOT).
+        A KnowledgeGraphSnapshot is already in memory, so it is returned as-is.
+        """
+        if os.getenv("KG_SNAPSHOT_PATH"):
+            return self.graph
+        if self._case_knowledge is None:
+            graph = self.graph
+            with self._lock:
+                if self._case_knowledge is None:
+                    from RAG.utils.kgCache import CaseKnowledgeCache
+                    self._case_knowledge = CaseKnowledgeCache(
+                        graph,
+                        max_items=int(os.getenv("KG_CACHE_SIZE", "4096")),
+                        snapshot_path=os.getenv("KG_CACHE_SNAPSHOT") or None,
+                    )
+        return self._case_knowledge
+
+    @property
+    def reranker(self):
+        from RAG.utils.reranker import get_reranker
+        return get_reranker()
+
+    @property
+    def retriever(self):
+        from RAG.QdrantRetriever import get_retriever
+        return get_retriever()
+
+    def warmup(self, graph: bool = True, reranker: bool = True, retriever: bool = True):
+        """Create the requested handles now (and load the models behind them)."""
+        if graph:
+            if os.getenv("KG_SNAPSHOT_PATH"):
+                self.graph
+            else:
+                self.graph.query("RETURN 1")
+        if reranker:
+            self.reranker.warmup()
+        if retriever:
+            from RAG.utils.embeddings import warmup as warmup_embeddings
+            self.retriever  # builds the Qdrant clients and loads the label index
+            warmup_embeddings()
+
+    def close(self):
+        if self._case_knowledge is not None:
+            self._case_knowledge.save_snapshot()
+        with self._lock:
+            graph, self._neo4j_graph = self._neo4j_graph, None
+            self._snapshot = self._case_knowledge = None
+        if graph is not None:
+            driver = getattr(graph, "_driver", None)
+            if driver is not None:
+                driver.close()
+
+
+resources = ResourceRegistry()
+
+
+def get_graph():
+    """Shared graph handle (Neo4j, or the snapshot stand-in), created on first use."""
+    return resources.graph
+
+
+def get_case_knowledge():
+    """Shared cached knowledge-graph source for get_cases_knowledge_graph."""
+    return resources.case_knowledge
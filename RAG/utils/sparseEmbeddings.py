@@ -0,0 +1,269 @@
+"""
+BM25 sparse vectors for hybrid (dense + keyword) retrieval.
+
+Exact symptom / location keywords ("Thanda Safari", "Teluk Intan") are poorly
+served by dense vectors alone. Qdrant stores a named sparse vector next to
+`nomic-embed-text` and applies IDF server-side, so here we only need the
+fastembed BM25 term weights.
+
+New collections should declare it at creation time and get BM25 vectors in
+the same upsert as the dense ones:
+
+    client.create_collection(name, vectors_config=..., sparse_vectors_config=sparse_vectors_config())
+
+Qdrant cannot add a sparse vector to an existing collection (update_collection
+only changes vectors it already has), so for one created without it the
+backfill migrates: a new collection `<name>__<vector>` is created with the full
+config of the old one (vectors, HNSW, optimizer, WAL, quantization, sharding,
+payload indexes) plus the sparse vector, the points are copied into it with
+their BM25 vectors, and once its point count matches, the alias `<name>` is
+switched to it and only then is the old collection deleted. Queries keep using
+`<name>` throughout. An interrupted run is resumed by running it again: the
+new collection is kept and the copy (an idempotent upsert) is redone. Once the
+vector exists, the backfill just recomputes it in place with update_vectors:
+
+    python -m RAG.utils.sparseEmbeddings --collection nomic_text_vectors
+"""
+import argparse
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+    HnswConfigDiff,
+    Modifier,
+    OptimizersConfigDiff,
+    PointStruct,
+    PointVectors,
+    SparseVector,
+    SparseVectorParams,
+    WalConfigDiff,
+)
+
+BM25_MODEL_ID = "Qdrant/bm25"
+SPARSE_VECTOR_NAME = "bm25"
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def _get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from fastembed import SparseTextEmbedding
+                _model = SparseTextEmbedding(BM25_MODEL_ID)
+    return _model
+
+
+def _to_sparse_vector(emb) -> SparseVector:
+    return SparseVector(indices=emb.indices.tolist(), values=emb.values.tolist())
+
+
+def embed_sparse_query(text: str) -> SparseVector:
+    return _to_sparse_vector(next(iter(_get_model().query_embed(text))))
+
+
+def embed_sparse_queries(texts: List[str]) -> List[SparseVector]:
+    return [_to_sparse_vector(e) for e in _get_model().query_embed(texts)]
+
+
+def embed_sparse_documents(texts: List[str], batch_size: int = 256) -> List[SparseVector]:
+    return [_to_sparse_vector(e) for e in _get_model().embed(texts, batch_size=batch_size)]
+
+
+def sparse_vectors_config(vector_name: str = SPARSE_VECTOR_NAME) -> Dict[str, SparseVectorParams]:
+    """sparse_vectors_config for create_collection: BM25 term weights, IDF applied by Qdrant."""
+    return {vector_name: SparseVectorParams(modifier=Modifier.IDF)}
+
+
+def _with_sparse(points, vector_name: str):
+    """Point vectors (as dicts) with `vector_name` computed from payload["text"]."""
+    texts = [(p.payload or {}).get("text") for p in points]
+    todo = [i for i, text in enumerate(texts) if text]
+    sparse = dict(zip(todo, embed_sparse_documents([texts[i] for i in todo]))) if todo else {}
+    out = []
+    for i, p in enumerate(points):
+        # an unnamed dense vector is addressed as "" next to named sparse ones
+        vectors = dict(p.vector) if isinstance(p.vector, dict) else {"": p.vector}
+        if i in sparse:
+            vectors[vector_name] = sparse[i]
+        out.append(vectors)
+    return out
+
+
+def _copy_points(
+    client: QdrantClient,
+    source: str,
+    target: str,
+    page_size: int,
+    transform: Optional[Callable] = None,
+) -> int:
+    """Copy every point (vectors + payload) from source to target; transform maps a page to its vectors."""
+    copied = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=source,
+            with_payload=True,
+            with_vectors=True,
+            limit=page_size,
+            offset=offset,
+        )
+        if points:
+            vectors = transform(points) if transform else [p.vector for p in points]
+            client.upsert(
+                collection_name=target,
+                points=[PointStruct(id=p.id, vector=v, payload=p.payload) for p, v in zip(points, vectors)],
+                wait=True,
+            )
+            copied += len(points)
+        if offset is None:
+            return copied
+
+
+def _as_diff(config, diff_cls):
+    return diff_cls(**config.model_dump(exclude_none=True)) if config is not None else None
+
+
+def _create_like(client: QdrantClient, info, collection_name: str, vector_name: str):
+    """Create collection_name with info's full config and payload indexes, plus the sparse vector."""
+    params = info.config.params
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config=params.vectors,
+        sparse_vectors_config={**(params.sparse_vectors or {}), **sparse_vectors_config(vector_name)},
+        shard_number=params.shard_number,
+        sharding_method=params.sharding_method,
+        replication_factor=params.replication_factor,
+        write_consistency_factor=params.write_consistency_factor,
+        on_disk_payload=params.on_disk_payload,
+        hnsw_config=_as_diff(info.config.hnsw_config, HnswConfigDiff),
+        optimizers_config=_as_diff(info.config.optimizer_config, OptimizersConfigDiff),
+        wal_config=_as_diff(info.config.wal_config, WalConfigDiff),
+        quantization_config=info.config.quantization_config,
+    )
+    for field_name, schema in (info.payload_schema or {}).items():
+        client.create_payload_index(collection_name, field_name=field_name, field_schema=schema.data_type)
+
+
+def _alias_target(client: QdrantClient, alias_name: str) -> Optional[str]:
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == alias_name:
+            return alias.collection_name
+    return None
+
+
+def _point_count(client: QdrantClient, collection_name: str) -> int:
+    return client.count(collection_name=collection_name, exact=True).count
+
+
+def _migrate_with_sparse(client: QdrantClient, collection_name: str, vector_name: str, page_size: int) -> int:
+    """
+    Copy collection_name (a collection, or an alias of one) into a new
+    collection declaring `vector_name`, then point the alias collection_name at
+    it. The old collection is deleted only after the switch.
+    """
+    source = _alias_target(client, collection_name)
+    target = f"{source or collection_name}__{vector_name}"
+
+    if source is None and not client.collection_exists(collection_name):
+        # a previous run died between deleting the original and creating the alias
+        if not client.collection_exists(target):
+            raise RuntimeError(f"Collection {collection_name!r} does not exist")
+        client.update_collection_aliases(change_aliases_operations=[
+            CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=collection_name)),
+        ])
+        return _point_count(client, target)
+
+    source = source or collection_name
+    if not client.collection_exists(target):
+        _create_like(client, client.get_collection(source), target, vector_name)
+    # on a rerun the target is kept and the upserts simply overwrite what was copied
+    copied = _copy_points(client, source, target, page_size, transform=lambda pts: _with_sparse(pts, vector_name))
+
+    expected, actual = _point_count(client, source), _point_count(client, target)
+    if actual != expected:
+        raise RuntimeError(
+            f"Migration of {collection_name!r} incomplete: {target!r} has {actual} points, {source!r} has {expected}; "
+            "rerun to resume"
+        )
+
+    create = CreateAliasOperation(create_alias=CreateAlias(collection_name=target, alias_name=collection_name))
+    if source != collection_name:
+        # alias -> old collection: swap in one atomic request
+        client.update_collection_aliases(change_aliases_operations=[
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=collection_name)),
+            create,
+        ])
+        client.delete_collection(source)
+    else:
+        # a concrete collection has to go before an alias can take its name
+        client.delete_collection(collection_name)
+        client.update_collection_aliases(change_aliases_operations=[create])
+    return copied
+
+
+def backfill_sparse_vectors(
+    client: QdrantClient,
+    collection_name: str,
+    vector_name: str = SPARSE_VECTOR_NAME,
+    page_size: int = 256,
+) -> int:
+    """
+    Compute the IDF-weighted sparse vector `vector_name` for every point from
+    payload["text"]. If the collection does not declare it yet, it is migrated
+    to a new collection behind an alias (see module docstring). Returns points written.
+    """
+    if not client.collection_exists(collection_name) and _alias_target(client, collection_name) is None:
+        return _migrate_with_sparse(client, collection_name, vector_name, page_size)  # finish a cut-short switch
+    info = client.get_collection(collection_name)
+    if vector_name not in (info.config.params.sparse_vectors or {}):
+        return _migrate_with_sparse(client, collection_name, vector_name, page_size)
+
+    updated = 0
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            with_payload=["text"],
+            with_vectors=False,
+            limit=page_size,
+            offset=offset,
+        )
+        points = [p for p in points or [] if (p.payload or {}).get("text")]
+        if points:
+            vectors = embed_sparse_documents([p.payload["text"] for p in points])
+            client.update_vectors(
+                collection_name=collection_name,
+                points=[PointVectors(id=p.id, vector={vector_name: v}) for p, v in zip(points, vectors)],
+            )
+            updated += len(points)
+        if offset is None:
+            break
+
+    return updated
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Add BM25 sparse vectors to a Qdrant collection.")
+    parser.add_argument("--collection", default="nomic_text_vectors")
+    parser.add_argument("--vector-name", default=SPARSE_VECTOR_NAME)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    n = backfill_sparse_vectors(client, args.collection, args.vector_name)
+    print(f"Wrote '{args.vector_name}' sparse vectors for {n} points in {args.collection}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Before/after latency of the case-label enrichment step against a live Qdrant.
+
+"before" replays the old N+1 pattern (one full-payload scroll of up to 128
+points per case); "after" is _gather_cases_sections (one filtered scroll).
+
+    python benchmarks/case_enrichment.py --cases Case91 Case102 Case147 --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchValue
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+from RAG.utils.queryVectorDB import CASE_LABEL_SECTIONS, _gather_cases_sections
+
+load_dotenv()
+
+
+def gather_per_case(client, collection, case_ids):
+    """The pre-optimization enrichment: one scroll per case, full payloads."""
+    out = {}
+    for case_id in case_ids:
+        labels = {sec: None for sec in CASE_LABEL_SECTIONS}
+        points, _ = client.scroll(
+            collection_name=collection,
+            scroll_filter=Filter(must=[FieldCondition(key="case", match=MatchValue(value=case_id))]),
+            with_payload=True,
+            with_vectors=False,
+            limit=128,
+        )
+        for p in points or []:
+            payload = p.payload or {}
+            sec = payload.get("section")
+            if sec in labels and labels[sec] is None:
+                labels[sec] = payload.get("text")
+        out[case_id] = labels
+    return out
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        samples.append(1000 * (time.perf_counter() - t))
+    return result, samples
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--collection", default="nomic_text_vectors")
+    parser.add_argument("--cases", nargs="+", default=["Case91", "Case102", "Case147", "Case120", "Case133"])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+
+    before, before_ms = timed(lambda: gather_per_case(client, args.collection, args.cases), args.repeat)
+    after, after_ms = timed(lambda: _gather_cases_sections(client, args.collection, args.cases), args.repeat)
+
+    if before != after:
+        print("WARNING: enrichment results differ between the two strategies")
+
+    for name, samples in (("before (per case)", before_ms), ("after (single scroll)", after_ms)):
+        print(
+            f"{name:<22} median {statistics.median(samples):7.1f} ms   "
+            f"max {max(samples):7.1f} ms   ({len(args.cases)} cases, {args.repeat} runs)"
+        )
+
+
+if __name__ == "__main__":
+    main()
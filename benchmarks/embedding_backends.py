@@ -0,0 +1,122 @@
+"""
+Latency / memory benchmark for the embedding backends.
+
+Each backend runs in its own process so peak RSS is measured in isolation.
+The ONNX export (which needs the torch model) runs in a separate process
+first, so the onnx row measures serving from the cached .onnx file.
+The "min cos" column is each backend's worst cosine similarity to the PyTorch
+fp32 reference; the pass/fail parity gate is tests/test_onnx_parity.py.
+
+    python benchmarks/embedding_backends.py --backends torch int8 onnx --n 256
+"""
+import argparse
+import multiprocessing as mp
+import os
+import re
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+def load_texts(n: int):
+    """Chunk texts from data/chunk_outputs, the same material that is indexed in Qdrant."""
+    texts = []
+    for path in sorted(Path(project_root, "data", "chunk_outputs").glob("Case*.txt")):
+        parts = re.split(r"^=+\s*\nCHUNK\s+\d+\s*\n=+\s*\n", path.read_text(encoding="utf-8"), flags=re.MULTILINE)
+        texts.extend(p.strip() for p in parts[1:] if p.strip())
+        if len(texts) >= n:
+            break
+    return texts[:n]
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _run_backend(backend: str, texts, batch_size: int, queue):
+    from RAG.utils.embeddings import embed_nomic_texts, embed_nomic_text, warmup
+
+    t0 = time.perf_counter()
+    warmup(backend)  # onnx: loads the cached file, torch weights are never read
+    load_s = time.perf_counter() - t0
+
+    # single-query latency (what a live request pays)
+    single = []
+    for text in texts[:32]:
+        t = time.perf_counter()
+        embed_nomic_text(text)
+        single.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    emb = embed_nomic_texts(texts, task_type="search_document", batch_size=batch_size, backend=backend)
+    batch_s = time.perf_counter() - t
+
+    queue.put({
+        "backend": backend,
+        "load_s": load_s,
+        "single_p50_ms": 1000 * float(np.percentile(single, 50)),
+        "single_p95_ms": 1000 * float(np.percentile(single, 95)),
+        "batch_texts_per_s": len(texts) / batch_s,
+        "max_rss_mb": _max_rss_mb(),
+        "embeddings": emb,
+    })
+
+
+def _export_backend(backend: str):
+    from RAG.utils.embeddings import warmup
+
+    warmup(backend)
+
+
+def run_backend(backend: str, texts, batch_size: int) -> dict:
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    # EMBEDDING_BACKEND is read at import time in the child, so single-query
+    # calls (no explicit backend) use the backend under test too
+    os.environ["EMBEDDING_BACKEND"] = backend
+    if backend == "onnx":
+        # export / quantize once outside the measured process (no-op when cached)
+        proc = ctx.Process(target=_export_backend, args=(backend,))
+        proc.start()
+        proc.join()
+    proc = ctx.Process(target=_run_backend, args=(backend, texts, batch_size, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--n", type=int, default=256, help="number of chunk texts to embed")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = load_texts(args.n)
+    print(f"Embedding {len(texts)} chunks per backend...\n")
+
+    backends = list(dict.fromkeys(["torch", *args.backends]))  # torch is the parity reference
+    results = {b: run_backend(b, texts, args.batch_size) for b in backends}
+    reference = results["torch"]["embeddings"]
+
+    print(f"{'backend':<8} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'texts/s':>9} {'RSS MB':>8} {'min cos':>8}")
+    for backend, r in results.items():
+        # rows are L2-normalized, so the dot product is the cosine similarity
+        cos = np.einsum("ij,ij->i", reference, r["embeddings"])
+        print(
+            f"{backend:<8} {r['load_s']:>7.1f} {r['single_p50_ms']:>8.1f} {r['single_p95_ms']:>8.1f} "
+            f"{r['batch_texts_per_s']:>9.1f} {r['max_rss_mb']:>8.0f} {cos.min():>8.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark of the Python side of get_cases_knowledge_graph.
+
+A fake graph returns synthetic records for a few hundred cases with dense
+neighborhoods, in the old per-neighbor format (query_v3: one {label, val} map
+per neighbor, regrouped with eight list comprehensions) and in the new
+server-grouped format (one {rel, vals} pair per relationship type).
+No Neo4j needed.
+
+    python benchmarks/kg_grouping.py --cases 300 --neighbors 60
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+from RAG.utils.queryVectorDB import KG_RELATIONS, get_cases_knowledge_graph
+
+LABELS = {rel: label for rel, (_, label) in KG_RELATIONS.items()}
+
+
+class FakeGraph:
+    def __init__(self, records):
+        self._records = records
+
+    def query(self, query, params=None):
+        return self._records
+
+
+def make_neighbors(n_cases, n_neighbors, seed=0):
+    rng = random.Random(seed)
+    rels = list(KG_RELATIONS)
+    return {
+        cid: [(rng.choice(rels), f"value {cid}-{j} " + "x" * rng.randint(5, 60)) for j in range(n_neighbors)]
+        for cid in range(1, n_cases + 1)
+    }
+
+
+def old_records(neighbors):
+    return [
+        {"id": cid, "attributes": [{"label": LABELS[rel], "val": val} for rel, val in items]}
+        for cid, items in neighbors.items()
+    ]
+
+
+def new_records(neighbors):
+    out = []
+    for cid, items in neighbors.items():
+        grouped = {}
+        for rel, val in items:
+            grouped.setdefault(rel, []).append(val)
+        out.append({"id": cid, "groups": [{"rel": rel, "vals": vals} for rel, vals in grouped.items()]})
+    return out
+
+
+def old_grouping(records, ids):
+    """The previous implementation: eight list comprehensions per case."""
+    results_lookup = {rec['id']: rec for rec in records}
+    output_parts = []
+    for cid in ids:
+        record = results_lookup.get(cid)
+        if record:
+            attrs = record['attributes']
+            groups = {
+                label: [item['val'] for item in attrs if item.get('label') == label]
+                for label in (*LABELS.values(), 'General')
+            }
+            output_parts.append({
+                "has_info": True,
+                "case_id": cid,
+                **{label: f"{label}: {', '.join(vals)}" if vals else None for label, vals in groups.items()},
+            })
+        else:
+            output_parts.append({"has_info": False})
+    return output_parts
+
+
+def bench(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=300)
+    parser.add_argument("--neighbors", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    neighbors = make_neighbors(args.cases, args.neighbors)
+    ids = list(neighbors)
+    case_list = [f"Case{cid}" for cid in ids]
+    old, new = old_records(neighbors), new_records(neighbors)
+
+    old_ms = bench(lambda: old_grouping(old, ids), args.repeat)
+    new_ms = bench(lambda: get_cases_knowledge_graph(FakeGraph(new), case_list), args.repeat)
+
+    print(f"{args.cases} cases x {args.neighbors} neighbors")
+    print(f"old (8 scans per case)       {old_ms:8.2f} ms")
+    print(f"new (server-grouped, 1 pass) {new_ms:8.2f} ms   ({old_ms / new_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Closed-loop load test against the diagnosis service (Generate_Response/server.py).
+
+N concurrent workers send requests back-to-back for a fixed number of requests
+and the script reports throughput, p50/p95/p99 latency and error/503 counts.
+
+    python benchmarks/load_bench.py --endpoint /diagnose --concurrency 8 --requests 100
+    python benchmarks/load_bench.py --endpoint /retrieve --concurrency 32 --requests 1000
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "My 10 year old nephew visited the Thanda Safari with us last week. Now he is sick with a fever, skin rash and itching foot. what is happening to him?",
+    "A farmer from Teluk Intan has had high fever, severe headache and muscle pain in the calves for five days after the floods.",
+    "A traveller back from West Africa has cyclical fevers with chills and sweating every other day.",
+    "A child has had a fever for a week with abdominal pain, constipation and a rose-colored rash on the trunk.",
+    "After a trip to Southeast Asia, a woman has sudden high fever, pain behind the eyes and joint pain with a low platelet count.",
+]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def worker(client, endpoint, questions, counter, latencies, statuses, total):
+    while next(counter) < total:
+        question = next(questions)
+        t = time.perf_counter()
+        try:
+            resp = await client.post(endpoint, json={"question": question})
+            statuses[resp.status_code] += 1
+            if resp.status_code == 200:
+                latencies.append(time.perf_counter() - t)
+        except httpx.HTTPError as e:
+            statuses[type(e).__name__] += 1
+
+
+async def run(args):
+    questions = DEFAULT_QUESTIONS
+    if args.questions:
+        with open(args.questions, encoding="utf-8") as fh:
+            questions = [line.strip() for line in fh if line.strip()]
+
+    counter = itertools.count()
+    cycle = itertools.cycle(questions)
+    latencies, statuses = [], Counter()
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*[
+            worker(client, args.endpoint, cycle, counter, latencies, statuses, args.requests)
+            for _ in range(args.concurrency)
+        ])
+        elapsed = time.perf_counter() - t0
+
+    print(f"{args.endpoint}: {args.requests} requests, concurrency {args.concurrency}, {elapsed:.1f}s")
+    print(f"status counts: {dict(statuses)}")
+    if latencies:
+        print(f"throughput    {len(latencies) / elapsed:8.2f} req/s (successful)")
+        print(f"latency mean  {statistics.mean(latencies) * 1000:8.0f} ms")
+        for q in (0.50, 0.95, 0.99):
+            print(f"latency p{int(q * 100):<3}  {percentile(latencies, q) * 1000:8.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/diagnose", choices=["/diagnose", "/retrieve"])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--questions", help="text file, one question per line")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Per-call cost of the hot-path debug output, before/after level-gated logging.
+
+"before" replays the old unconditional prints (search_vectors_v2 final hits
++ the context/response dump in generate_response) into os.devnull, i.e. a
+lower bound on what they cost against a real terminal or log collector.
+"after" calls the current _log_hits / _log_generation with the logger at
+WARNING (the default), then at DEBUG with sampled and full dumps.
+
+    python benchmarks/logging_overhead.py --hits 3 --repeat 2000
+"""
+import argparse
+import contextlib
+import logging
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+from RAG.utils.queryVectorDB import _log_hits
+from Generate_Response.trindsLangchain import _log_generation
+
+TEXT = ("Patient presented with fever, headache, myalgia and a maculopapular rash "
+        "after returning from a rural area; platelets were low and liver enzymes raised. ") * 12
+
+
+def make_hits(n):
+    return [
+        SimpleNamespace(id=i, score=0.9 - i * 0.01, payload={
+            "case": f"Case{100 + i}", "section": "History", "text": TEXT,
+            "Disease Name Short": "Dengue", "Final Diagnosis": "Dengue fever " * 20, "Vitals": "T 39.2C HR 110 " * 15,
+        })
+        for i in range(n)
+    ]
+
+
+def old_prints(hits, contexts, all_contexts, result):
+    print(f"\n🔎 Final Results (Top {len(hits)}):")
+    for i, r in enumerate(hits, 1):
+        py = r.payload
+        print(f"{i}. Score: {r.score:.4f} | Case: {py.get('case')} | Section: {py.get('section')}")
+        print(f"   Text: {(py.get('text') or '')}...")
+        if py.get('Final Diagnosis'):
+            print(f"   [Enriched] Diagnosis: {py.get('Final Diagnosis')}...")
+        print("-" * 40)
+    print(f"Retrieved {len(contexts)} contexts: {all_contexts}\n")
+    print(f"Response: {result}")
+    print(f"Result's content:\n{result.content}")
+
+
+def new_logging(hits, contexts, all_contexts, result):
+    _log_hits("Final results", hits)
+    _log_generation(contexts, all_contexts, result)
+
+
+def timeit(fn, args, repeat):
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1e6, statistics.mean(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--hits", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    hits = make_hits(args.hits)
+    contexts = [TEXT * 2 for _ in hits]
+    all_contexts = "\n------\n".join(contexts)
+    result = SimpleNamespace(
+        content="Diagnosis: Dengue fever\nExplanation: " + "Fever with rash and thrombocytopenia. " * 3,
+        response_metadata={"prompt_eval_count": 1800, "eval_count": 60},
+    )
+    call = (hits, contexts, all_contexts, result)
+
+    devnull = open(os.devnull, "w")
+    handler = logging.StreamHandler(devnull)
+    for name in ("RAG.utils.queryVectorDB", "Generate_Response.trindsLangchain"):
+        logger = logging.getLogger(name)
+        logger.addHandler(handler)
+        logger.propagate = False
+
+    def set_level(level):
+        for name in ("RAG.utils.queryVectorDB", "Generate_Response.trindsLangchain"):
+            logging.getLogger(name).setLevel(level)
+
+    rows = []
+    with contextlib.redirect_stdout(devnull):
+        rows.append(("before: print (devnull)", *timeit(old_prints, call, args.repeat)))
+        set_level(logging.WARNING)
+        rows.append(("after: logging at WARNING", *timeit(new_logging, call, args.repeat)))
+        set_level(logging.DEBUG)
+        os.environ["DEBUG_DUMP_SAMPLE"] = "0.01"
+        rows.append(("after: DEBUG, 1% sampled", *timeit(new_logging, call, args.repeat)))
+        os.environ["DEBUG_DUMP_SAMPLE"] = "1.0"
+        rows.append(("after: DEBUG, every call", *timeit(new_logging, call, args.repeat)))
+
+    print(f"{args.hits} hits, {len(all_contexts)} chars of context, {args.repeat} calls each")
+    print(f"{'mode':<28}{'median µs':>12}{'mean µs':>12}")
+    for mode, median, mean in rows:
+        print(f"{mode:<28}{median:>12.1f}{mean:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Round trip: a snapshot exported from a graph answers get_cases_knowledge_graph
+exactly like the graph it was exported from.
+"""
+import pytest
+
+from RAG.utils.kgCache import READ_VERSION_QUERY, read_graph_version
+from RAG.utils.kgSnapshot import EXPORT_QUERY, KnowledgeGraphSnapshot, export_kg_snapshot
+from RAG.utils.queryVectorDB import CASE_KNOWLEDGE_QUERY, get_cases_knowledge_graph
+
+CASES = [
+    {"case_id": 1, "file_id": None},
+    {"case_id": 2, "file_id": None},
+    {"case_id": None, "file_id": 7},  # older dataset keys cases by file_id
+    {"case_id": 3, "file_id": None},  # no neighbors
+]
+EDGES = [
+    (0, "HAS_SYMPTOM", "fever"),
+    (0, "HAS_INFO", "Returned from Ghana two weeks ago"),
+    (0, "HAS_SYMPTOM", "headache"),
+    (0, "OF_DISEASE", "Malaria"),
+    (1, "LOCATED_IN", "Brazil"),
+    (1, "HAS_RISK_FACTOR", "Unvaccinated"),
+    (1, "HAS_SYMPTOM", "fever"),  # value shared with case 1
+    (2, "HAS_INVESTIGATION", "Blood smear"),
+    (2, "HAS_EPIDEMIOLOGY", None),  # neighbor without name/content
+]
+
+
+class StubGraph:
+    """Answers the three Cypher queries the snapshot code sends, like Neo4j would."""
+
+    def __init__(self, cases, edges, version="v42"):
+        self.cases, self.edges, self.version = cases, edges, version
+
+    def _case_id(self, case):
+        return case["case_id"] if case["case_id"] is not None else case["file_id"]
+
+    def query(self, query, params=None):
+        params = params or {}
+        if query == EXPORT_QUERY:
+            rows = []
+            for i, case in enumerate(self.cases):
+                edges = [(rel, val) for c, rel, val in self.edges if c == i] or [(None, None)]
+                rows.extend({"id": self._case_id(case), **case, "rel": rel, "val": val} for rel, val in edges)
+            return rows
+        if query == CASE_KNOWLEDGE_QUERY:
+            records = []
+            for i, case in enumerate(self.cases):
+                if case["case_id"] not in params["ids"] and case["file_id"] not in params["ids"]:
+                    continue
+                groups = {}
+                for c, rel, val in self.edges:
+                    if c == i:
+                        vals = groups.setdefault(rel, [])
+                        if val is not None:  # collect() drops nulls
+                            vals.append(val)
+                records.append({
+                    "id": self._case_id(case),
+                    "groups": [{"rel": rel, "vals": vals} for rel, vals in groups.items()]
+                    or [{"rel": None, "vals": []}],
+                })
+            return records
+        if query == READ_VERSION_QUERY:
+            return [{"version": self.version}]
+        raise AssertionError("unexpected query")
+
+
+@pytest.fixture
+def graphs(tmp_path):
+    live = StubGraph(CASES, EDGES)
+    path = tmp_path / "kg_snapshot.npz"
+    counts = export_kg_snapshot(live, str(path))
+    assert counts == {"cases": 4, "edges": 8, "strings": 7}
+    return live, KnowledgeGraphSnapshot(str(path))
+
+
+def test_snapshot_matches_live_graph(graphs):
+    live, snapshot = graphs
+    case_list = ["Case2", "Case1", "Case7", "Case3", "Case99", "Case1"]
+    assert get_cases_knowledge_graph(snapshot, case_list) == get_cases_knowledge_graph(live, case_list)
+
+
+def test_snapshot_keeps_graph_version(graphs):
+    live, snapshot = graphs
+    assert read_graph_version(snapshot) == read_graph_version(live) == "v42"
+
+
+def test_snapshot_rejects_other_queries(graphs):
+    _, snapshot = graphs
+    with pytest.raises(ValueError, match="MATCH \\(n\\) RETURN n"):
+        snapshot.query("MATCH (n) RETURN n")
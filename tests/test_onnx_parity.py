@@ -0,0 +1,56 @@
+"""
+The int8 ONNX backend must embed like the PyTorch fp32 reference.
+Needs the model weights (downloaded on first run) and onnxruntime; the export
+is cached under EMBEDDING_ONNX_DIR, so only the first run pays for it.
+"""
+import re
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from RAG.utils.embeddings import embed_nomic_texts, unload
+
+PARITY_THRESHOLD = 0.99
+CHUNK_DIR = Path(__file__).resolve().parents[1] / "data" / "chunk_outputs"
+
+
+def _chunk_texts(n: int):
+    texts = []
+    for path in sorted(CHUNK_DIR.glob("Case*.txt")):
+        parts = re.split(r"^=+\s*\nCHUNK\s+\d+\s*\n=+\s*\n", path.read_text(encoding="utf-8"), flags=re.MULTILINE)
+        texts.extend(p.strip() for p in parts[1:] if p.strip())
+        if len(texts) >= n:
+            break
+    return texts[:n]
+
+
+@pytest.fixture(scope="module")
+def texts():
+    texts = _chunk_texts(32)
+    if not texts:
+        pytest.skip(f"no chunk texts under {CHUNK_DIR}")
+    # short queries exercise the least-padded batches
+    return texts + ["fever and rash after travel to Ghana", "search for dengue cases in Brazil"]
+
+
+@pytest.fixture(scope="module", autouse=True)
+def release_models():
+    yield
+    unload("torch")
+    unload("onnx")
+
+
+@pytest.mark.parametrize("task_type", ["search_document", "search_query"])
+def test_onnx_int8_matches_torch_fp32(monkeypatch, texts, task_type):
+    monkeypatch.setenv("EMBEDDING_ONNX_QUANTIZE", "1")
+    reference = embed_nomic_texts(texts, task_type=task_type, backend="torch")
+    onnx = embed_nomic_texts(texts, task_type=task_type, backend="onnx")
+
+    # rows are L2-normalized, so the dot product is the cosine similarity
+    cos = np.einsum("ij,ij->i", reference, onnx)
+    assert cos.min() > PARITY_THRESHOLD, f"min cosine {cos.min():.4f} at {texts[int(cos.argmin())][:60]!r}"